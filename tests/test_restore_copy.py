@@ -0,0 +1,73 @@
+"""Full direct-mode restore copy: destination entries whose type changed since the backup."""
+
+import os
+import tempfile
+import unittest
+
+from web.restore import _parallel_copy_tree
+
+
+class ParallelCopyTreeTypeChangeTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.src = os.path.join(self._tmp.name, 'src')
+        self.dst = os.path.join(self._tmp.name, 'dst')
+        os.makedirs(self.src)
+        os.makedirs(self.dst)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(data)
+
+    def _read(self, path):
+        with open(path) as f:
+            return f.read()
+
+    def test_symlink_to_dir_replaced_by_other_symlink(self):
+        for root in (self.src, self.dst):
+            os.makedirs(os.path.join(root, 'v1'))
+            os.makedirs(os.path.join(root, 'v2'))
+        os.symlink('v2', os.path.join(self.src, 'current'))
+        os.symlink('v1', os.path.join(self.dst, 'current'))
+
+        _parallel_copy_tree(self.src, self.dst)
+
+        self.assertEqual(os.readlink(os.path.join(self.dst, 'current')), 'v2')
+        self.assertEqual(os.listdir(os.path.join(self.dst, 'v1')), [])
+
+    def test_file_replaced_by_dir(self):
+        self._write(os.path.join(self.src, 'conf', 'app.ini'), 'new')
+        self._write(os.path.join(self.dst, 'conf'), 'old file')
+
+        self.assertEqual(_parallel_copy_tree(self.src, self.dst), 1)
+
+        self.assertEqual(self._read(os.path.join(self.dst, 'conf', 'app.ini')), 'new')
+
+    def test_dir_replaced_by_file(self):
+        self._write(os.path.join(self.src, 'conf'), 'new file')
+        self._write(os.path.join(self.dst, 'conf', 'app.ini'), 'old')
+
+        self.assertEqual(_parallel_copy_tree(self.src, self.dst), 1)
+
+        self.assertEqual(self._read(os.path.join(self.dst, 'conf')), 'new file')
+
+    def test_symlink_replaced_by_file_is_not_written_through(self):
+        outside = os.path.join(self._tmp.name, 'outside')
+        self._write(outside, 'keep')
+        self._write(os.path.join(self.src, 'data'), 'restored')
+        os.symlink(outside, os.path.join(self.dst, 'data'))
+
+        _parallel_copy_tree(self.src, self.dst)
+
+        self.assertFalse(os.path.islink(os.path.join(self.dst, 'data')))
+        self.assertEqual(self._read(os.path.join(self.dst, 'data')), 'restored')
+        self.assertEqual(self._read(outside), 'keep')
+
+
+if __name__ == '__main__':
+    unittest.main()
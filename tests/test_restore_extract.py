@@ -0,0 +1,83 @@
+"""Selective extraction from .tar.zst archives through the tar index."""
+
+import io
+import os
+import tarfile
+import tempfile
+import unittest
+
+import zstandard
+
+from web import restore
+
+
+class ExtractIndexedTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.archive = os.path.join(self._tmp.name, 'job.20260101_010000.tar.zst')
+        self.target = os.path.join(self._tmp.name, 'out')
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _make_archive(self, add_members, encoding='utf-8'):
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode='w', format=tarfile.GNU_FORMAT, encoding=encoding) as tf:
+            add_members(tf)
+        with open(self.archive, 'wb') as f:
+            f.write(zstandard.ZstdCompressor().compress(buf.getvalue()))
+        with restore.open_zst(self.archive) as stream:
+            return restore._build_tar_index(stream, [1])
+
+    @staticmethod
+    def _add_file(tf, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = 1767225600
+        tf.addfile(info, io.BytesIO(data))
+
+    def test_file_with_its_hardlink(self):
+        def add_members(tf):
+            # Padding members keep the writer busy so the link would race the file
+            for i in range(40):
+                self._add_file(tf, f'pad/{i}.bin', os.urandom(4096))
+            self._add_file(tf, 't.bin', b'payload')
+            link = tarfile.TarInfo('t.link')
+            link.type = tarfile.LNKTYPE
+            link.linkname = 't.bin'
+            tf.addfile(link)
+
+        index = self._make_archive(add_members)
+        files = [f'pad/{i}.bin' for i in range(40)] + ['t.bin', 't.link']
+
+        for _ in range(5):
+            target = tempfile.mkdtemp(dir=self._tmp.name)
+            self.assertEqual(restore._extract_indexed(self.archive, index, files, target), 42)
+            with open(os.path.join(target, 't.link'), 'rb') as f:
+                self.assertEqual(f.read(), b'payload')
+            self.assertTrue(os.path.samefile(os.path.join(target, 't.bin'), os.path.join(target, 't.link')))
+
+    def test_latin1_member_name_survives_index_file(self):
+        # tarfile reads the latin-1 byte back as a surrogate escape, as for any non-UTF-8 name
+        index = self._make_archive(lambda tf: self._add_file(tf, 'docs/caf\xe9.txt', b'latin-1'),
+                                   encoding='latin-1')
+        name = 'docs/caf\udce9.txt'
+        self.assertIn(name, index['names'])
+
+        index_path = os.path.join(self._tmp.name, 'job.idx')
+        restore._write_json_atomic(index_path, index)
+        loaded = restore._load_index_file(index_path)
+        self.assertEqual(loaded, index)
+
+        entries = restore._list_archive_dir(loaded, 'docs/')
+        self.assertEqual([e['name'] for e in entries], ['caf\udce9.txt'])
+        self.assertEqual(restore._search_tar_index(index_path, loaded, 'caf', 10), [(name, 7)])
+
+        self.assertEqual(restore._extract_indexed(self.archive, loaded, [name], self.target), 1)
+        with open(os.path.join(os.fsencode(self.target), b'docs', b'caf\xe9.txt'), 'rb') as f:
+            self.assertEqual(f.read(), b'latin-1')
+
+
+if __name__ == '__main__':
+    unittest.main()
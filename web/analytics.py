@@ -2,21 +2,32 @@
 
 import os
 import re
-import gzip
-import sqlite3
-from datetime import datetime
-from flask import Blueprint, request, jsonify
+import hashlib
+import statistics
+from flask import Blueprint, Response, request, jsonify
 
-from .db import DB_PATH, get_job_display_name, get_all_job_configs
+from .db import (
+    DB_PATH, get_db, get_job_display_name, get_all_display_names, get_all_job_configs,
+    decompress_log, decompress_log_bytes
+)
+from .utils import ttl_cache
 
 analytics_bp = Blueprint('analytics', __name__)
 
+# Dashboards and Prometheus poll on a fixed cadence; writes clear these caches
+STATS_CACHE_TTL = 5
+METRICS_CACHE_TTL = 15
 
+# Storage usage snapshot, refreshed in the background by run.py
+STORAGE_PROBE_INTERVAL = 30
+storage_cache = {}
+
+
+@ttl_cache(STATS_CACHE_TTL)
 def get_backup_stats():
     """Get backup statistics with normalized names and compression stats."""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
+        conn = get_db()
 
         stats = conn.execute('''
             SELECT job_name,
@@ -35,9 +46,16 @@ def get_backup_stats():
             SELECT * FROM backup_jobs WHERE status != 'idle' ORDER BY last_run DESC
         ''').fetchall()
 
+        # One run per (job, start minute): keep the latest row of each bucket
         recent_runs = conn.execute('''
-            SELECT * FROM backup_runs
-            WHERE start_time > datetime('now', '-30 days')
+            SELECT id, job_name, start_time, end_time, duration, status,
+                   transferred_mb, percent_complete, error_message, log_file
+            FROM backup_runs
+            WHERE id IN (
+                SELECT MAX(id) FROM backup_runs
+                WHERE start_time > datetime('now', '-30 days')
+                GROUP BY job_name, substr(start_time, 1, 16)
+            )
             ORDER BY start_time DESC
         ''').fetchall()
 
@@ -53,37 +71,19 @@ def get_backup_stats():
               AND bm.compression_ratio > 0
         ''').fetchone()
 
-        conn.close()
+        names = get_all_display_names()
 
         stats_normalized = []
         for row in stats:
             stat_dict = dict(row)
-            stat_dict['display_name'] = get_job_display_name(stat_dict['job_name'])
+            stat_dict['display_name'] = get_job_display_name(stat_dict['job_name'], names)
             stats_normalized.append(stat_dict)
 
         recent_runs_normalized = []
-        seen_combinations = set()
-
         for row in recent_runs:
             run_dict = dict(row)
-            run_dict['display_name'] = get_job_display_name(run_dict['job_name'])
-
-            if 'log_content' in run_dict:
-                del run_dict['log_content']
-
-            if run_dict['start_time']:
-                try:
-                    dt = datetime.fromisoformat(run_dict['start_time'].replace('Z', '+00:00'))
-                    dt_rounded = dt.replace(second=0, microsecond=0)
-                    unique_key = f"{run_dict['job_name']}-{dt_rounded.isoformat()}"
-
-                    if unique_key not in seen_combinations:
-                        seen_combinations.add(unique_key)
-                        recent_runs_normalized.append(run_dict)
-                except Exception:
-                    recent_runs_normalized.append(run_dict)
-            else:
-                recent_runs_normalized.append(run_dict)
+            run_dict['display_name'] = get_job_display_name(run_dict['job_name'], names)
+            recent_runs_normalized.append(run_dict)
 
         compression_data = {
             'avg_compression_ratio': compression_stats[0] if compression_stats and compression_stats[0] else 0,
@@ -113,6 +113,29 @@ def get_backup_stats():
         }
 
 
+@ttl_cache(STATS_CACHE_TTL)
+def get_dashboard_aggregates():
+    """30-day dashboard figures; rates and durations are averaged per job like /api/stats."""
+    conn = get_db()
+    row = conn.execute('''
+        SELECT AVG(success_rate) AS success_rate,
+               AVG(avg_duration) AS avg_duration,
+               SUM(total_transferred) AS total_data,
+               substr(MAX(last_run), 9, 2) || '/' || substr(MAX(last_run), 6, 2) || '/' ||
+               substr(MAX(last_run), 1, 4) AS last_backup
+        FROM (
+            SELECT COALESCE(AVG(CASE WHEN status = 'success' THEN 1 ELSE 0 END) * 100, 0) AS success_rate,
+                   COALESCE(AVG(duration), 0) AS avg_duration,
+                   COALESCE(SUM(transferred_mb), 0) AS total_transferred,
+                   MAX(start_time) AS last_run
+            FROM backup_runs
+            WHERE start_time > datetime('now', '-30 days')
+            GROUP BY job_name
+        )
+    ''').fetchone()
+    return dict(row)
+
+
 # --- Routes ---
 
 @analytics_bp.route('/api/stats')
@@ -125,28 +148,11 @@ def api_stats():
 def api_metrics():
     """API to get aggregated metrics for the dashboard."""
     try:
-        stats_data = get_backup_stats()
-        all_stats = stats_data.get('stats', [])
-        recent_runs = stats_data.get('recent_runs', [])
-
-        if all_stats:
-            success_rate = sum(s.get('success_rate', 0) for s in all_stats) / len(all_stats)
-            avg_duration = sum(s.get('avg_duration', 0) for s in all_stats) / len(all_stats)
-            total_data = sum(s.get('total_transferred', 0) for s in all_stats)
-        else:
-            success_rate = 0
-            avg_duration = 0
-            total_data = 0
-
-        last_backup = '--'
-        if recent_runs:
-            try:
-                last_run = recent_runs[0]
-                if last_run.get('start_time'):
-                    dt = datetime.fromisoformat(last_run['start_time'].replace('Z', '+00:00'))
-                    last_backup = dt.strftime('%d/%m/%Y')
-            except Exception:
-                pass
+        aggregates = get_dashboard_aggregates()
+        success_rate = aggregates['success_rate'] or 0
+        avg_duration = aggregates['avg_duration'] or 0
+        total_data = aggregates['total_data'] or 0
+        last_backup = aggregates['last_backup'] or '--'
 
         return jsonify({
             'success_rate': f"{int(success_rate)}%",
@@ -168,33 +174,37 @@ def api_metrics():
 def api_job_status():
     """API to get the last backup status of each job."""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
+        conn = get_db()
 
         job_names = conn.execute('SELECT job_name FROM job_configs WHERE enabled = 1').fetchall()
         jobs = [row['job_name'] for row in job_names]
 
+        # Latest run of every enabled job in one pass
+        last_runs = {row['job_name']: row for row in conn.execute('''
+            SELECT job_name, status,
+                   substr(start_time, 9, 2) || '/' || substr(start_time, 6, 2) || ' ' ||
+                   substr(start_time, 12, 5) AS start_label
+            FROM (
+                SELECT job_name, status, start_time,
+                       ROW_NUMBER() OVER (PARTITION BY job_name ORDER BY start_time DESC) AS rn
+                FROM backup_runs
+                WHERE job_name IN (SELECT job_name FROM job_configs WHERE enabled = 1)
+            ) WHERE rn = 1
+        ''')}
+
         jobs_status = {}
         for job in jobs:
-            result = conn.execute('''
-                SELECT status, start_time, end_time
-                FROM backup_runs WHERE job_name = ?
-                ORDER BY start_time DESC LIMIT 1
-            ''', (job,)).fetchone()
+            result = last_runs.get(job)
 
             if result:
-                try:
-                    dt = datetime.fromisoformat(result['start_time'].replace('Z', '+00:00'))
-                    jobs_status[job] = {
-                        'status': result['status'] or 'unknown',
-                        'date': dt.strftime('%d/%m %H:%M')
-                    }
-                except Exception:
-                    jobs_status[job] = {'status': result['status'] or 'unknown', 'date': '--'}
+                # Wall-clock time as stored, sliced from the ISO string
+                jobs_status[job] = {
+                    'status': result['status'] or 'unknown',
+                    'date': result['start_label'] or '--'
+                }
             else:
                 jobs_status[job] = {'status': 'unknown', 'date': '--'}
 
-        conn.close()
         return jsonify(jobs_status)
     except Exception as e:
         print(f"Error api_job_status: {e}")
@@ -205,48 +215,53 @@ def api_job_status():
 def get_logs_list():
     """API to get the list of logs from the DB."""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
-
-        logs_from_db = conn.execute('''
-            SELECT job_name, start_time, end_time, duration, status,
-                   transferred_mb, log_file, id
-            FROM backup_runs
-            WHERE log_file IS NOT NULL
-            ORDER BY start_time DESC
-            LIMIT 100
-        ''').fetchall()
-
-        conn.close()
-
-        logs = []
-        for row in logs_from_db:
-            try:
-                log_dict = dict(row)
-                backup_name = get_job_display_name(log_dict['job_name'])
-                start_time = datetime.fromisoformat(log_dict['start_time'].replace('Z', '+00:00'))
-                size_str = f"{log_dict['transferred_mb'] or 0} MB"
-
-                logs.append({
-                    'filename': f"run_{log_dict['id']}.log",
-                    'backup_name': backup_name,
-                    'date': start_time.isoformat(),
-                    'size': size_str,
-                    'status': log_dict['status'] or 'unknown',
-                    'duration': log_dict['duration'],
-                    'transferred_mb': log_dict['transferred_mb'],
-                    'run_id': log_dict['id']
-                })
-            except Exception as e:
-                print(f"Error parsing log DB {row}: {e}")
-                continue
-
-        return jsonify({'logs': logs})
+        conn = get_db()
+        # Same fallback as get_job_display_name() for jobs without a config
+        conn.create_function('title', 1, str.title, deterministic=True)
+
+        # Rows are serialized by SQLite; the subquery fixes the array order
+        logs_json = conn.execute('''
+            SELECT json_group_array(json_object(
+                'filename', 'run_' || id || '.log',
+                'backup_name', CASE WHEN job_name = 'all' THEN 'Full Backup'
+                                    ELSE COALESCE(display_name, title(job_name)) END,
+                'date', start_time,
+                'size', COALESCE(transferred_mb, 0) || ' MB',
+                'status', COALESCE(status, 'unknown'),
+                'duration', duration,
+                'transferred_mb', transferred_mb,
+                'run_id', id
+            ))
+            FROM (
+                SELECT br.id, br.job_name, br.start_time, br.duration, br.status,
+                       br.transferred_mb, jc.display_name
+                FROM backup_runs br
+                LEFT JOIN job_configs jc ON jc.job_name = br.job_name
+                WHERE br.log_file IS NOT NULL
+                ORDER BY br.start_time DESC
+                LIMIT 100
+            )
+        ''').fetchone()[0]
+
+        return Response(f'{{"logs":{logs_json or "[]"}}}', mimetype='application/json')
     except Exception as e:
         print(f"Error get_logs_list: {e}")
         return jsonify({'error': str(e)}), 500
 
 
+def _raw_log_response(log_blob):
+    """Plain-text log body with an ETag so clients can revalidate without a re-download."""
+    if isinstance(log_blob, str):
+        log_blob = log_blob.encode('utf-8')
+    etag = hashlib.blake2b(log_blob, digest_size=16).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(decompress_log_bytes(log_blob), mimetype='text/plain')
+    response.set_etag(etag)
+    return response
+
+
 @analytics_bp.route('/log/<path:log_identifier>')
 def get_log_content(log_identifier):
     """Get log content from the DB."""
@@ -254,21 +269,21 @@ def get_log_content(log_identifier):
         if log_identifier.startswith('run_') and log_identifier.endswith('.log'):
             run_id = log_identifier[4:-4]
 
-            conn = sqlite3.connect(DB_PATH)
+            conn = get_db()
             result = conn.execute('''
-                SELECT log_content, job_name, start_time
-                FROM backup_runs WHERE id = ?
+                SELECT l.log_blob, r.job_name, r.start_time
+                FROM backup_runs r
+                LEFT JOIN backup_run_logs l ON l.run_id = r.id
+                WHERE r.id = ?
             ''', (run_id,)).fetchone()
-            conn.close()
 
             if result:
                 log_content_compressed, job_name, start_time = result
                 if log_content_compressed:
+                    if request.args.get('raw', type=int):
+                        return _raw_log_response(log_content_compressed)
                     try:
-                        if isinstance(log_content_compressed, bytes):
-                            log_content = gzip.decompress(log_content_compressed).decode('utf-8')
-                        else:
-                            log_content = log_content_compressed
+                        log_content = decompress_log(log_content_compressed)
 
                         return jsonify({
                             'content': log_content,
@@ -289,11 +304,26 @@ def get_log_content(log_identifier):
         return jsonify({'error': str(e)}), 500
 
 
+def _describe(values, current):
+    """Mean/stddev/median/MAD of a sample plus the z-score of `current`."""
+    if not values:
+        return {'mean': None, 'stddev': None, 'median': None, 'mad': None,
+                'zscore': None, 'outliers': 0}
+    mean = statistics.fmean(values)
+    stddev = statistics.pstdev(values, mean)
+    median = statistics.median(values)
+    mad = statistics.median(abs(v - median) for v in values)
+    zscore = (current - mean) / stddev if stddev and current is not None else None
+    outliers = sum(1 for v in values if abs(v - mean) > 3 * stddev) if stddev else 0
+    return {'mean': mean, 'stddev': stddev, 'median': median, 'mad': mad,
+            'zscore': zscore, 'outliers': outliers}
+
+
 @analytics_bp.route('/api/anomalies/<job_name>')
 def check_anomalies(job_name):
     """Detect anomalies for a job based on its 14-day history."""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_db()
 
         last_run = conn.execute('''
             SELECT transferred_mb, duration, status
@@ -302,56 +332,62 @@ def check_anomalies(job_name):
         ''', (job_name,)).fetchone()
 
         if not last_run or last_run[2] != 'success':
-            conn.close()
             return jsonify({'job': job_name, 'anomalies': []})
 
         current_size_mb, current_duration, _ = last_run
 
-        stats = conn.execute('''
-            SELECT
-                AVG(transferred_mb) as avg_size,
-                AVG(duration) as avg_duration,
-                COUNT(*) as count
+        history = conn.execute('''
+            SELECT transferred_mb, duration
             FROM backup_runs
             WHERE job_name = ? AND status = 'success'
               AND start_time > datetime('now', '-14 days')
-        ''', (job_name,)).fetchone()
+        ''', (job_name,)).fetchall()
 
-        conn.close()
+        sizes = [row[0] for row in history if row[0] is not None]
+        durations = [row[1] for row in history if row[1] is not None]
+        size_stats = _describe(sizes, current_size_mb)
+        duration_stats = _describe(durations, current_duration)
+        avg_size = size_stats['mean']
+        avg_duration = duration_stats['mean']
+        sample_size = len(history)
 
         anomalies = []
 
-        if stats and stats[2] > 5:
-            avg_size = stats[0] or 0
-            avg_duration = stats[1] or 0
-
-            if avg_size > 0 and abs(current_size_mb - avg_size) / avg_size > 0.30:
+        if sample_size > 5:
+            if avg_size and abs(current_size_mb - avg_size) / avg_size > 0.30:
                 diff = ((current_size_mb - avg_size) / avg_size) * 100
                 anomalies.append({
                     'type': 'size',
                     'severity': 'warning',
                     'message': f"Abnormal size: {diff:+.1f}% vs average",
                     'current': current_size_mb,
-                    'average': avg_size
+                    'average': avg_size,
+                    'zscore': size_stats['zscore']
                 })
 
-            if avg_duration > 0 and current_duration > avg_duration * 1.5:
+            if avg_duration and current_duration > avg_duration * 1.5:
                 diff = ((current_duration - avg_duration) / avg_duration) * 100
                 anomalies.append({
                     'type': 'duration',
                     'severity': 'warning',
                     'message': f"Abnormal duration: {diff:+.1f}% vs average",
                     'current': current_duration,
-                    'average': avg_duration
+                    'average': avg_duration,
+                    'zscore': duration_stats['zscore']
                 })
 
         return jsonify({
             'job': job_name,
             'anomalies': anomalies,
             'stats': {
-                'avg_size_mb': stats[0] if stats else 0,
-                'avg_duration': stats[1] if stats else 0,
-                'sample_size': stats[2] if stats else 0
+                'avg_size_mb': avg_size,
+                'avg_duration': avg_duration,
+                'sample_size': sample_size,
+                'size_stddev': size_stats['stddev'],
+                'size_median_mb': size_stats['median'],
+                'size_mad_mb': size_stats['mad'],
+                'duration_stddev': duration_stats['stddev'],
+                'outliers': size_stats['outliers'] + duration_stats['outliers']
             }
         })
     except Exception as e:
@@ -359,38 +395,50 @@ def check_anomalies(job_name):
         return jsonify({'error': str(e)}), 500
 
 
+def probe_storage_usage():
+    """Capacity/used/free MB of the backup storage mount."""
+    storage_path = os.environ.get('STORAGE_MOUNT_PATH', '/mnt/data')
+    try:
+        st = os.statvfs(storage_path)
+        # Same figures as df: used counts reserved blocks, free is what users can allocate
+        nas_capacity_mb = st.f_blocks * st.f_frsize // (1024 * 1024)
+        nas_used_mb = (st.f_blocks - st.f_bfree) * st.f_frsize // (1024 * 1024)
+        nas_free_mb = st.f_bavail * st.f_frsize // (1024 * 1024)
+    except OSError as e:
+        print(f"statvfs error: {e}")
+        nas_capacity_mb = 0
+        nas_used_mb = 0
+        nas_free_mb = 0
+
+    return {
+        'nas_used_mb': int(nas_used_mb),
+        'nas_used_gb': int(nas_used_mb / 1024) if nas_used_mb else 0,
+        'nas_free_mb': int(nas_free_mb),
+        'nas_free_gb': int(nas_free_mb / 1024) if nas_free_mb else 0,
+        'nas_capacity_mb': nas_capacity_mb,
+        'nas_capacity_gb': int(nas_capacity_mb / 1024) if nas_capacity_mb else 0
+    }
+
+
+def refresh_storage_usage():
+    """Probe the storage mount and publish the result for request handlers."""
+    storage_cache['usage'] = probe_storage_usage()
+
+
+def get_storage_usage():
+    """Latest storage snapshot; probes inline only until the first refresh."""
+    usage = storage_cache.get('usage')
+    if usage is None:
+        refresh_storage_usage()
+        usage = storage_cache['usage']
+    return usage
+
+
 @analytics_bp.route('/api/storage-prediction')
 def storage_prediction():
     """Display current storage usage."""
     try:
-        import subprocess
-        storage_path = os.environ.get('STORAGE_MOUNT_PATH', '/mnt/data')
-        try:
-            df_output = subprocess.check_output(['df', '-k', storage_path], universal_newlines=True)
-            lines = df_output.strip().split('\n')
-            if len(lines) >= 2:
-                fields = lines[1].split()
-                nas_capacity_mb = int(fields[1]) // 1024
-                nas_used_mb = int(fields[2]) // 1024
-                nas_free_mb = int(fields[3]) // 1024
-            else:
-                nas_capacity_mb = 0
-                nas_used_mb = 0
-                nas_free_mb = 0
-        except Exception as e:
-            print(f"df error: {e}")
-            nas_capacity_mb = 0
-            nas_used_mb = 0
-            nas_free_mb = 0
-
-        return jsonify({
-            'nas_used_mb': int(nas_used_mb),
-            'nas_used_gb': int(nas_used_mb / 1024) if nas_used_mb else 0,
-            'nas_free_mb': int(nas_free_mb),
-            'nas_free_gb': int(nas_free_mb / 1024) if nas_free_mb else 0,
-            'nas_capacity_mb': nas_capacity_mb,
-            'nas_capacity_gb': int(nas_capacity_mb / 1024) if nas_capacity_mb else 0
-        })
+        return jsonify(get_storage_usage())
     except Exception as e:
         print(f"Error storage_prediction: {e}")
         return jsonify({'error': str(e)}), 500
@@ -400,10 +448,9 @@ def storage_prediction():
 def get_job_status(job):
     """Return the status of a job."""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_db()
         cursor = conn.execute('SELECT status FROM backup_jobs WHERE job_name = ?', (job,))
         row = cursor.fetchone()
-        conn.close()
 
         if row:
             return jsonify({'status': row[0]})
@@ -412,95 +459,109 @@ def get_job_status(job):
         return jsonify({'error': str(e)}), 500
 
 
+# Per-job exposition lines, rendered entirely by SQLite in job_configs order.
+# Jobs without runs in the 30-day window still export zeroed counters.
+PROMETHEUS_JOB_LINES_SQL = '''
+    WITH jobs AS (
+        SELECT id AS ord, job_name, '{backup_job="' || job_name || '"} ' AS label
+        FROM job_configs WHERE enabled = 1
+    ),
+    last_run AS (
+        SELECT job_name, status, duration, transferred_mb, start_ts FROM (
+            SELECT job_name, status, duration, transferred_mb, start_ts,
+                   ROW_NUMBER() OVER (PARTITION BY job_name ORDER BY start_time DESC) AS rn
+            FROM backup_runs
+            WHERE job_name IN (SELECT job_name FROM jobs)
+        ) WHERE rn = 1
+    ),
+    stats_30d AS (
+        SELECT
+            job_name,
+            COUNT(*) as total_runs,
+            COUNT(CASE WHEN status = 'success' THEN 1 END) as success_count,
+            COUNT(CASE WHEN status = 'error' THEN 1 END) as error_count,
+            AVG(duration) as avg_duration,
+            AVG(transferred_mb) as avg_size
+        FROM backup_runs
+        WHERE start_time > datetime('now', '-30 days')
+        GROUP BY job_name
+    ),
+    lines AS (
+        SELECT ord, 1 AS k, 'backup_last_run_timestamp' || label || COALESCE(start_ts, 0) AS line
+        FROM jobs JOIN last_run USING (job_name)
+        UNION ALL
+        SELECT ord, 2, 'backup_duration_seconds' || label || COALESCE(duration, 0)
+        FROM jobs JOIN last_run USING (job_name)
+        UNION ALL
+        SELECT ord, 3, 'backup_size_mb' || label || COALESCE(transferred_mb, 0)
+        FROM jobs JOIN last_run USING (job_name)
+        UNION ALL
+        SELECT ord, 4, 'backup_success' || label || (status IS 'success')
+        FROM jobs JOIN last_run USING (job_name)
+        UNION ALL
+        SELECT ord, 5, 'backup_total_runs' || label || COALESCE(total_runs, 0)
+        FROM jobs LEFT JOIN stats_30d USING (job_name)
+        UNION ALL
+        SELECT ord, 6, 'backup_success_total' || label || COALESCE(success_count, 0)
+        FROM jobs LEFT JOIN stats_30d USING (job_name)
+        UNION ALL
+        SELECT ord, 7, 'backup_errors_total' || label || COALESCE(error_count, 0)
+        FROM jobs LEFT JOIN stats_30d USING (job_name)
+        UNION ALL
+        SELECT ord, 8, 'backup_success_rate_percent' || label ||
+               printf('%.2f', CASE WHEN total_runs > 0 THEN success_count * 1.0 / total_runs * 100 ELSE 0 END)
+        FROM jobs LEFT JOIN stats_30d USING (job_name)
+        UNION ALL
+        SELECT ord, 9, 'backup_avg_duration_seconds' || label || printf('%.2f', COALESCE(avg_duration, 0))
+        FROM jobs LEFT JOIN stats_30d USING (job_name)
+        UNION ALL
+        SELECT ord, 10, 'backup_avg_size_mb' || label || printf('%.2f', COALESCE(avg_size, 0))
+        FROM jobs LEFT JOIN stats_30d USING (job_name)
+    )
+    SELECT group_concat(line, char(10)) FROM (SELECT line FROM lines ORDER BY ord, k)
+'''
+
+
+@ttl_cache(METRICS_CACHE_TTL)
+def render_prometheus_metrics():
+    """Build the encoded Prometheus text exposition body."""
+    conn = get_db()
+    buf = bytearray()
+
+    job_lines = conn.execute(PROMETHEUS_JOB_LINES_SQL).fetchone()[0]
+    if job_lines:
+        buf += job_lines.encode('utf-8')
+        buf += b'\n'
+
+    global_stats = conn.execute('''
+        SELECT
+            COUNT(*) as total_runs,
+            COUNT(CASE WHEN status = 'success' THEN 1 END) as total_success,
+            COUNT(CASE WHEN status = 'error' THEN 1 END) as total_errors,
+            SUM(transferred_mb) as total_size_mb
+        FROM backup_runs
+    ''').fetchone()
+
+    if global_stats:
+        buf += b'backup_global_total_runs %d\n' % (global_stats['total_runs'] or 0)
+        buf += b'backup_global_success_total %d\n' % (global_stats['total_success'] or 0)
+        buf += b'backup_global_errors_total %d\n' % (global_stats['total_errors'] or 0)
+        buf += b'backup_global_total_size_mb %d\n' % (global_stats['total_size_mb'] or 0)
+
+    db_size = os.path.getsize(DB_PATH) / (1024 * 1024)
+    buf += b'backup_db_size_mb %.2f\n' % db_size
+
+    from .app import running_processes
+    buf += b'backup_running_jobs %d\n' % len(running_processes)
+
+    return bytes(buf)
+
+
 @analytics_bp.route('/metrics')
 def prometheus_metrics():
     """Export metrics in Prometheus format."""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
-
-        metrics = []
-
-        job_rows = conn.execute('SELECT job_name FROM job_configs WHERE enabled = 1').fetchall()
-        jobs = [row['job_name'] for row in job_rows]
-
-        for job in jobs:
-            last_run = conn.execute('''
-                SELECT status, duration, transferred_mb, start_time
-                FROM backup_runs WHERE job_name = ?
-                ORDER BY start_time DESC LIMIT 1
-            ''', (job,)).fetchone()
-
-            if last_run:
-                success = 1 if last_run['status'] == 'success' else 0
-                duration = last_run['duration'] or 0
-                size_mb = last_run['transferred_mb'] or 0
-
-                timestamp = 0
-                if last_run['start_time']:
-                    try:
-                        dt = datetime.fromisoformat(last_run['start_time'].replace('Z', '+00:00'))
-                        timestamp = int(dt.timestamp())
-                    except Exception:
-                        pass
-
-                metrics.append(f'backup_last_run_timestamp{{backup_job="{job}"}} {timestamp}')
-                metrics.append(f'backup_duration_seconds{{backup_job="{job}"}} {duration}')
-                metrics.append(f'backup_size_mb{{backup_job="{job}"}} {size_mb}')
-                metrics.append(f'backup_success{{backup_job="{job}"}} {success}')
-
-            stats_30d = conn.execute('''
-                SELECT
-                    COUNT(*) as total_runs,
-                    COUNT(CASE WHEN status = 'success' THEN 1 END) as success_count,
-                    COUNT(CASE WHEN status = 'error' THEN 1 END) as error_count,
-                    AVG(duration) as avg_duration,
-                    AVG(transferred_mb) as avg_size
-                FROM backup_runs
-                WHERE job_name = ? AND start_time > datetime('now', '-30 days')
-            ''', (job,)).fetchone()
-
-            if stats_30d:
-                total = stats_30d['total_runs'] or 0
-                success_cnt = stats_30d['success_count'] or 0
-                errors = stats_30d['error_count'] or 0
-                avg_dur = stats_30d['avg_duration'] or 0
-                avg_sz = stats_30d['avg_size'] or 0
-                success_rate = (success_cnt / total * 100) if total > 0 else 0
-
-                metrics.append(f'backup_total_runs{{backup_job="{job}"}} {total}')
-                metrics.append(f'backup_success_total{{backup_job="{job}"}} {success_cnt}')
-                metrics.append(f'backup_errors_total{{backup_job="{job}"}} {errors}')
-                metrics.append(f'backup_success_rate_percent{{backup_job="{job}"}} {success_rate:.2f}')
-                metrics.append(f'backup_avg_duration_seconds{{backup_job="{job}"}} {avg_dur:.2f}')
-                metrics.append(f'backup_avg_size_mb{{backup_job="{job}"}} {avg_sz:.2f}')
-
-        global_stats = conn.execute('''
-            SELECT
-                COUNT(*) as total_runs,
-                COUNT(CASE WHEN status = 'success' THEN 1 END) as total_success,
-                COUNT(CASE WHEN status = 'error' THEN 1 END) as total_errors,
-                SUM(transferred_mb) as total_size_mb
-            FROM backup_runs
-        ''').fetchone()
-
-        if global_stats:
-            metrics.append(f'backup_global_total_runs {global_stats["total_runs"] or 0}')
-            metrics.append(f'backup_global_success_total {global_stats["total_success"] or 0}')
-            metrics.append(f'backup_global_errors_total {global_stats["total_errors"] or 0}')
-            metrics.append(f'backup_global_total_size_mb {global_stats["total_size_mb"] or 0}')
-
-        db_size = os.path.getsize(DB_PATH) / (1024 * 1024)
-        metrics.append(f'backup_db_size_mb {db_size:.2f}')
-
-        from .app import running_processes
-        running_count = len(running_processes)
-        metrics.append(f'backup_running_jobs {running_count}')
-
-        conn.close()
-
-        output = '\n'.join(metrics) + '\n'
-        return output, 200, {'Content-Type': 'text/plain; charset=utf-8'}
+        return Response(render_prometheus_metrics(), mimetype='text/plain')
     except Exception as e:
         print(f"Error prometheus_metrics: {e}")
         return f"# Error: {e}\n", 500, {'Content-Type': 'text/plain'}
@@ -3,26 +3,66 @@
 import os
 import re
 import time
+import select
+import signal
 import threading
 import subprocess
 import sqlite3
+import orjson
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from flask import Flask, request, jsonify, send_from_directory
+from flask.json.provider import DefaultJSONProvider
 from flask_socketio import SocketIO, emit
 
 from .utils import get_local_datetime
 from .db import (
     DB_PATH, init_db, log_backup_start, log_backup_end,
-    store_log_content_in_db, cleanup_old_data, get_job_display_name
+    store_log_content_in_db, cleanup_old_data, get_job_display_name, release_db
 )
 from .analytics import analytics_bp, get_backup_stats
 from .jobs import jobs_bp
 from .scheduler import scheduler_bp, scheduler, load_schedules
-from .restore import restore_bp
+from .restore import restore_bp, invalidate_rclone_listings, warm_search_indexes
 from .notifications import notifications_bp
 
 # --- Flask App ---
 
+class OrjsonProvider(DefaultJSONProvider):
+    """jsonify() and request JSON backed by orjson; unknown types fall back to Flask's encoder."""
+
+    options = orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS
+
+    @staticmethod
+    def default(obj):
+        if isinstance(obj, sqlite3.Row):
+            return dict(obj)
+        return DefaultJSONProvider.default(obj)
+
+    def _encode(self, obj):
+        try:
+            return orjson.dumps(obj, default=self.default, option=self.options)
+        except TypeError:
+            # Archive member names with surrogateescape'd bytes: only json can escape them
+            return super().dumps(obj).encode('utf-8')
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return self._encode(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self._encode(obj), mimetype=self.mimetype)
+
+
 app = Flask(__name__, static_folder='/app/web/static', static_url_path='/static')
+app.json = OrjsonProvider(app)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'change-me-in-production')
 
 socketio = SocketIO(
@@ -35,6 +75,8 @@ socketio = SocketIO(
     engineio_logger=False
 )
 
+app.teardown_appcontext(release_db)
+
 # Register blueprints
 app.register_blueprint(analytics_bp)
 app.register_blueprint(jobs_bp)
@@ -44,9 +86,32 @@ app.register_blueprint(notifications_bp)
 
 # --- Global state ---
 
+@dataclass(slots=True)
+class RunInfo:
+    """A backup process started by this app."""
+    process: subprocess.Popen
+    run_id: int | None  # None until log_backup_start has recorded the run
+    start_time: float
+    log_file: str
+
+
+# job_name -> RunInfo; mutate and iterate only while holding _PROC_LOCK
 running_processes = {}
+_PROC_LOCK = threading.Lock()
 PORT = int(os.environ.get('PORT', '9895'))
 
+# Environment for backup.sh, copied once; each run only adds its BACKUP_LOG_FILE
+_BASE_ENV = os.environ.copy()
+
+# Log compression and DB writes of finished backups run here, off the reaper thread
+POST_EXEC = ThreadPoolExecutor(max_workers=4, thread_name_prefix='backup-post')
+
+# Completions within this window share one stats aggregation and broadcast
+STATS_EMIT_DELAY = 0.25
+_stats_dirty = threading.Event()
+_stats_emitter_started = False
+_stats_emitter_lock = threading.Lock()
+
 
 # --- Static routes ---
 
@@ -72,184 +137,337 @@ def spa_redirect():
 
 # --- Execution routes ---
 
-def parse_log_stats_for_job(job_name, log_file_path=None):
-    """Parse stats from a specific job's log file."""
+_RE_BYTES_SENT = re.compile(rb'Total bytes sent:\s*(\d[\d,]*)')
+_RE_LOG_STATUS = re.compile(rb'Termin|Complete|chec|fail|Error')
+
+
+def read_log_file(log_file_path):
+    """Read a job log once as bytes; None if it doesn't exist."""
+    try:
+        with open(log_file_path, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def parse_log_stats(content):
+    """Parse transferred MB and completion percent from log bytes."""
     transferred_mb = 0
-    percent = 0
 
+    sent_matches = _RE_BYTES_SENT.findall(content)
+    if sent_matches:
+        # Strip thousands separators from the captures only, not from the whole log
+        total_bytes = sum(int(m.translate(None, b',')) for m in sent_matches)
+        transferred_mb = int(total_bytes / (1024 * 1024))
+
+    # One scan collects every status marker; completion still wins over failure words
+    markers = set(_RE_LOG_STATUS.findall(content))
+    if markers & {b"Termin", b"Complete"}:
+        percent = 100
+    elif markers:
+        percent = 0
+    else:
+        percent = 50
+
+    return transferred_mb, percent
+
+
+def parse_log_stats_for_job(job_name, log_file_path=None, content=None):
+    """Parse stats from a specific job's log file (or its already-read bytes)."""
     try:
-        if not log_file_path and job_name in running_processes:
-            log_file_path = running_processes[job_name]['log_file']
-
-        if not log_file_path or not os.path.exists(log_file_path):
-            return 0, 0
-
-        with open(log_file_path, 'r') as f:
-            content = f.read()
-
-            sent_matches = re.findall(r'Total bytes sent:\s*([\d,]+)', content)
-            if sent_matches:
-                total_bytes = sum(int(m.replace(',', '')) for m in sent_matches)
-                transferred_mb = int(total_bytes / (1024 * 1024))
-
-            if "Termin" in content or "Complete" in content:
-                percent = 100
-            elif "chec" in content or "fail" in content or "Error" in content:
-                percent = 0
-            else:
-                percent = 50
+        if content is None:
+            if not log_file_path:
+                with _PROC_LOCK:
+                    info = running_processes.get(job_name)
+                log_file_path = info.log_file if info else None
+            if not log_file_path:
+                return 0, 0
+            content = read_log_file(log_file_path)
+            if content is None:
+                return 0, 0
+
+        return parse_log_stats(content)
     except Exception as e:
         print(f"Error parse_log_stats_for_job {job_name}: {e}")
+        return 0, 0
 
-    return transferred_mb, percent
 
+def release_run(job_name, info):
+    """Stop tracking a run unless another run of the job has replaced it."""
+    with _PROC_LOCK:
+        if running_processes.get(job_name) is info:
+            del running_processes[job_name]
 
-def monitor_backup_process(process, job_name, run_id):
-    """Monitor a backup process and record results."""
-    try:
-        start_time = time.time()
-        print(f"Monitoring started for {job_name} (PID: {process.pid})")
 
-        return_code = process.wait()
-        final_duration = int(time.time() - start_time)
+def finalize_backup(job_name, run_id, return_code, final_duration):
+    """Store the log and results of an exited backup; returns the backup_status payload.
+
+    Returns None when kill_job already closed the run.
+    """
+    with _PROC_LOCK:
+        info = running_processes.get(job_name)
+    if info is None or info.run_id != run_id:
+        print(f"{job_name} exited after being stopped, nothing to finalize")
+        return None
+
+    try:
         status = 'success' if return_code == 0 else 'error'
 
         print(f"{job_name} completed in {final_duration}s with code {return_code}")
 
-        log_file_path = running_processes[job_name]['log_file']
-        transferred_mb, percent = parse_log_stats_for_job(job_name, log_file_path)
+        # Read the log once; stats parsing and DB storage share the bytes
+        log_file_path = info.log_file
+        log_data = read_log_file(log_file_path)
+        transferred_mb, percent = parse_log_stats_for_job(job_name, log_file_path, log_data)
 
-        store_log_content_in_db(run_id, log_file_path)
+        store_log_content_in_db(run_id, log_file_path, log_data)
 
         log_backup_end(job_name, status, final_duration, transferred_mb, percent,
-                       f"Exit code: {return_code}" if return_code != 0 else None)
+                       f"Exit code: {return_code}" if return_code != 0 else None, run_id=run_id)
 
-        if job_name in running_processes:
-            del running_processes[job_name]
+        release_run(job_name, info)
 
-        try:
-            socketio.emit('backup_status', {
-                'job': job_name,
-                'status': status,
-                'run_id': run_id,
-                'duration': final_duration,
-                'transferred_mb': transferred_mb,
-                'return_code': return_code
-            })
-            socketio.emit('backup_stats', get_backup_stats())
-        except Exception as e:
-            print(f"WebSocket emit error for {job_name}: {e}")
+        return {
+            'job': job_name,
+            'status': status,
+            'run_id': run_id,
+            'duration': final_duration,
+            'transferred_mb': transferred_mb,
+            'return_code': return_code
+        }
 
     except Exception as e:
         print(f"Monitoring error {job_name}: {e}")
-        if job_name in running_processes:
-            del running_processes[job_name]
-        log_backup_end(job_name, 'error', 0, error_msg=str(e))
-        try:
-            socketio.emit('backup_status', {
-                'job': job_name,
-                'status': 'error',
-                'run_id': run_id,
-                'error': str(e)
-            })
-        except Exception:
-            pass
+        release_run(job_name, info)
+        log_backup_end(job_name, 'error', 0, error_msg=str(e), run_id=run_id)
+        return {
+            'job': job_name,
+            'status': 'error',
+            'run_id': run_id,
+            'error': str(e)
+        }
 
 
-@app.route("/run")
-def run_job():
-    """Start a backup job."""
+def _stats_emitter_loop():
+    """Broadcast backup_stats once per burst of completions."""
+    while True:
+        _stats_dirty.wait()
+        socketio.sleep(STATS_EMIT_DELAY)
+        _stats_dirty.clear()
+        try:
+            socketio.emit('backup_stats', get_backup_stats())
+        except Exception as e:
+            print(f"WebSocket stats emit error: {e}")
+
+
+def schedule_stats_broadcast():
+    """Mark stats as changed; the emitter task sends them shortly after."""
+    global _stats_emitter_started
+    with _stats_emitter_lock:
+        if not _stats_emitter_started:
+            socketio.start_background_task(_stats_emitter_loop)
+            _stats_emitter_started = True
+    _stats_dirty.set()
+
+
+def emit_backup_completion(future):
+    """Executor callback: push a finished backup's status to clients and queue a stats refresh."""
+    payload = future.result()
+    if payload is None:
+        return
+    invalidate_rclone_listings()
+    if payload['status'] == 'success':
+        # The next search finds the new archive indexed instead of building it on the spot
+        warm_search_indexes(payload['job'])
     try:
-        job = request.args.get("job", "all")
-        print(f"Launch request for job: {job}")
-
-        if job == "all":
-            process = subprocess.Popen(
-                ["/bin/bash", "/app/backup.sh", "all"],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                universal_newlines=True
-            )
-            return jsonify({
-                'status': 'started',
-                'job': 'all',
-                'pid': process.pid,
-                'message': 'Sequence started'
-            })
-
-        if job in running_processes:
-            process = running_processes[job]['process']
-            if process.poll() is None:
-                return jsonify({
+        socketio.emit('backup_status', payload)
+        if 'error' not in payload:
+            schedule_stats_broadcast()
+    except Exception as e:
+        print(f"WebSocket emit error for {payload['job']}: {e}")
+
+
+def finish_backup_process(process, job_name, run_id, start_time):
+    """Collect an exited backup process and queue its post-processing."""
+    return_code = process.wait()
+    final_duration = int(time.time() - start_time)
+    POST_EXEC.submit(
+        finalize_backup, job_name, run_id, return_code, final_duration
+    ).add_done_callback(emit_backup_completion)
+
+
+def monitor_backup_process(process, job_name, run_id):
+    """Wait for a backup process in the current thread (fallback without pidfd)."""
+    start_time = time.time()
+    print(f"Monitoring started for {job_name} (PID: {process.pid})")
+    process.wait()
+    finish_backup_process(process, job_name, run_id, start_time)
+
+
+class ProcessReaper(threading.Thread):
+    """Single thread waiting on the pidfds of all running backups with epoll."""
+
+    def __init__(self):
+        super().__init__(name='process-reaper', daemon=True)
+        self._epoll = select.epoll()
+        self._lock = threading.Lock()
+        self._watched = {}
+
+    def register(self, process, job_name, run_id, start_time):
+        """Watch a process; raises OSError if pidfds are unavailable."""
+        pidfd = os.pidfd_open(process.pid)
+        with self._lock:
+            self._watched[pidfd] = (process, job_name, run_id, start_time)
+        self._epoll.register(pidfd, select.EPOLLIN)
+        print(f"Monitoring started for {job_name} (PID: {process.pid})")
+
+    def run(self):
+        while True:
+            try:
+                events = self._epoll.poll()
+            except InterruptedError:
+                continue
+            for pidfd, _ in events:
+                self._epoll.unregister(pidfd)
+                os.close(pidfd)
+                with self._lock:
+                    watched = self._watched.pop(pidfd, None)
+                if watched:
+                    finish_backup_process(*watched)
+
+
+_reaper = None
+_reaper_lock = threading.Lock()
+
+
+def watch_backup_process(process, job_name, run_id, start_time):
+    """Hand a backup process to the shared reaper, or to its own thread without pidfd support."""
+    global _reaper
+    if hasattr(os, 'pidfd_open') and hasattr(select, 'epoll'):
+        try:
+            with _reaper_lock:
+                if _reaper is None:
+                    reaper = ProcessReaper()
+                    reaper.start()
+                    _reaper = reaper
+            _reaper.register(process, job_name, run_id, start_time)
+            return
+        except OSError as e:
+            print(f"pidfd unavailable, falling back to monitor thread: {e}")
+
+    monitor_thread = threading.Thread(
+        target=monitor_backup_process,
+        args=(process, job_name, run_id),
+        name=f"monitor-{job_name}",
+        daemon=True
+    )
+    monitor_thread.start()
+
+
+def start_backup(job):
+    """Start a backup job, or the whole sequence for 'all'; returns the /run payload."""
+    print(f"Launch request for job: {job}")
+
+    if job == "all":
+        process = subprocess.Popen(
+            ["/bin/bash", "/app/backup.sh", "all"],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.STDOUT,
+            start_new_session=True
+        )
+        return {
+            'status': 'started',
+            'job': 'all',
+            'pid': process.pid,
+            'message': 'Sequence started'
+        }
+
+    # Held until the run is registered so two requests can't start the same job
+    with _PROC_LOCK:
+        info = running_processes.get(job)
+        if info is not None:
+            if info.process.poll() is None:
+                return {
                     'status': 'already_running',
                     'job': job,
-                    'pid': process.pid
-                })
-            else:
-                del running_processes[job]
+                    'pid': info.process.pid
+                }
+            del running_processes[job]
 
         local_now = get_local_datetime()
         timestamp = local_now.strftime("%Y-%m-%d_%H-%M-%S-%f")[:-3]
         log_file = f"/app/logs/backup_{job}_{timestamp}.log"
 
-        env = os.environ.copy()
-        env['BACKUP_LOG_FILE'] = log_file
-
+        # backup.sh tees its own log file; its stdout is never read. Its own
+        # session lets kill_job signal rsync and the other children too.
         process = subprocess.Popen(
             ["/bin/bash", "/app/backup.sh", job],
-            stdout=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
             stderr=subprocess.STDOUT,
-            universal_newlines=True,
-            env=env
+            env={**_BASE_ENV, 'BACKUP_LOG_FILE': log_file},
+            start_new_session=True
         )
+        start_time = time.time()
 
-        run_id = log_backup_start(job, log_file, process.pid)
+        info = running_processes[job] = RunInfo(process, None, start_time, log_file)
+        total_running = len(running_processes)
 
-        running_processes[job] = {
-            'process': process,
-            'run_id': run_id,
-            'start_time': time.time(),
-            'log_file': log_file
-        }
+    # The entry already blocks a second start, so the DB write runs outside the lock
+    run_id = info.run_id = log_backup_start(job, log_file, process.pid)
+    watch_backup_process(process, job, run_id, start_time)
 
-        monitor_thread = threading.Thread(
-            target=monitor_backup_process,
-            args=(process, job, run_id),
-            name=f"monitor-{job}",
-            daemon=True
-        )
-        monitor_thread.start()
+    return {
+        'status': 'started',
+        'job': job,
+        'run_id': run_id,
+        'pid': process.pid,
+        'total_running': total_running
+    }
 
-        return jsonify({
-            'status': 'started',
-            'job': job,
-            'run_id': run_id,
-            'pid': process.pid,
-            'total_running': len(running_processes)
-        })
 
+@app.route("/run")
+def run_job():
+    """Start a backup job."""
+    try:
+        return jsonify(start_backup(request.args.get("job", "all")))
     except Exception as e:
         print(f"Error run_job: {e}")
         return jsonify({'error': str(e)}), 500
 
 
+def signal_process_group(process, sig):
+    """Signal a backup and its children (it leads its own session)."""
+    try:
+        os.killpg(process.pid, sig)
+    except ProcessLookupError:
+        pass
+    except OSError:
+        process.send_signal(sig)
+
+
 @app.route("/kill")
 def kill_job():
     """Stop a running backup job."""
     try:
         job = request.args.get("job")
-        if not job or job not in running_processes:
+        # Claiming the entry first tells finalize_backup this run is already handled
+        with _PROC_LOCK:
+            info = running_processes.pop(job, None) if job else None
+        if info is None:
             return jsonify({'error': 'Job not found or not running'}), 404
 
-        process = running_processes[job]['process']
-        process.terminate()
-
-        time.sleep(2)
-        if process.poll() is None:
-            process.kill()
+        process = info.process
+        signal_process_group(process, signal.SIGTERM)
+        try:
+            process.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            signal_process_group(process, signal.SIGKILL)
+            process.wait()
 
-        log_backup_end(job, 'killed', 0, error_msg="Killed by user")
-        del running_processes[job]
+        # finalize_backup skips claimed runs, so the log is stored here
+        store_log_content_in_db(info.run_id, info.log_file)
+        # By id: a new run of the job may already have started
+        log_backup_end(job, 'killed', 0, error_msg="Killed by user", run_id=info.run_id)
 
         socketio.emit('backup_status', {'job': job, 'status': 'killed'})
 
@@ -270,13 +488,15 @@ def debug():
             'current_time': get_local_datetime().isoformat()
         }
 
-        for job, data in running_processes.items():
+        with _PROC_LOCK:
+            running = list(running_processes.items())
+        for job, info in running:
             debug_info['running_processes'][job] = {
-                'pid': data['process'].pid,
-                'run_id': data['run_id'],
-                'start_time': data['start_time'],
-                'duration': int(time.time() - data['start_time']),
-                'poll_status': data['process'].poll()
+                'pid': info.process.pid,
+                'run_id': info.run_id,
+                'start_time': info.start_time,
+                'duration': int(time.time() - info.start_time),
+                'poll_status': info.process.poll()
             }
 
         return jsonify({
@@ -284,42 +504,30 @@ def debug():
             'db_path': DB_PATH,
             'db_exists': os.path.exists(DB_PATH),
             'stats_count': len(db_stats['stats']),
-            'running_jobs': len(running_processes),
+            'running_jobs': len(running),
             'debug_info': debug_info
         })
     except Exception as e:
         return jsonify({'status': 'error', 'error': str(e)}), 500
 
 
-# --- Process cleanup ---
-
-def cleanup_finished_processes():
-    """Clean up finished processes from tracking."""
-    to_remove = []
-    for job_name, data in running_processes.items():
-        if data['process'].poll() is not None:
-            to_remove.append(job_name)
-
-    for job_name in to_remove:
-        del running_processes[job_name]
-
-    if to_remove:
-        socketio.emit('backup_stats', get_backup_stats())
-
-
 # --- WebSocket events ---
 
 @socketio.on('connect')
 def handle_connect():
     """Client WebSocket connected."""
-    emit('backup_stats', get_backup_stats())
-    for job, data in running_processes.items():
-        emit('backup_status', {
+    # One frame carries every running job; the dashboard reads stats over REST
+    with _PROC_LOCK:
+        running = list(running_processes.items())
+    now = time.time()
+    emit('backup_status_bulk', {
+        'jobs': [{
             'job': job,
             'status': 'running',
-            'run_id': data['run_id'],
-            'duration': int(time.time() - data['start_time'])
-        })
+            'run_id': info.run_id,
+            'duration': int(now - info.start_time)
+        } for job, info in running]
+    })
 
 
 @socketio.on('disconnect')
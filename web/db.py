@@ -2,11 +2,19 @@
 
 import sqlite3
 import os
+import atexit
+import queue
 import gzip
 import re
 import json
+import time
+import functools
+import threading
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 
+import zstandard
+
 from .utils import get_local_datetime
 
 DB_PATH = os.getenv('DB_PATH', '/app/logs/backup_stats.db')
@@ -46,125 +54,264 @@ DEMO_SEEDS = [
 ]
 
 
-def get_db():
-    """Get a database connection with WAL mode and busy timeout."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute('PRAGMA journal_mode=WAL')
+_local = threading.local()
+
+# Per-connection prepared-statement cache; the default of 128 is smaller than
+# the set of distinct statements the routes and background jobs run
+STATEMENT_CACHE_SIZE = 256
+
+# Idle connections handed back by finished requests (werkzeug runs each request
+# on a fresh thread, so a thread-local alone would reconnect every time)
+POOL_SIZE = max(4, os.cpu_count() or 1)
+_pool = queue.LifoQueue(maxsize=POOL_SIZE)
+
+
+def _connect():
+    """Open a connection with the per-connection PRAGMAs applied."""
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None,
+                           cached_statements=STATEMENT_CACHE_SIZE)
     conn.execute('PRAGMA busy_timeout=5000')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA wal_autocheckpoint=1000')
+    conn.execute('PRAGMA cache_size=-20000')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    conn.execute('PRAGMA mmap_size=268435456')
     conn.row_factory = sqlite3.Row
     return conn
 
 
+def get_db():
+    """Get this thread's database connection, taken from the pool on first use.
+
+    Callers must not close it. Request threads give it back at app-context
+    teardown (release_db); background threads keep theirs. It runs in
+    autocommit mode; group writes with transaction(). journal_mode=WAL is
+    persistent in the DB file and is set once by init_db().
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        try:
+            conn = _pool.get_nowait()
+        except queue.Empty:
+            conn = _connect()
+        _local.conn = conn
+    return conn
+
+
+@contextmanager
+def transaction():
+    """Run a block of writes atomically on this thread's connection.
+
+    BEGIN IMMEDIATE takes the write lock up front so the block can't fail
+    halfway on a lock upgrade. Nested use joins the outer transaction.
+    """
+    conn = get_db()
+    if conn.in_transaction:
+        yield conn
+        return
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+
+def release_db(exc=None):
+    """App-context teardown: roll back leftovers and return the connection to the pool."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        return
+    _local.conn = None
+    if conn.in_transaction:
+        conn.rollback()
+    try:
+        _pool.put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+
+@atexit.register
+def close_pool():
+    """Close the idle pooled connections at interpreter exit."""
+    while True:
+        try:
+            _pool.get_nowait().close()
+        except queue.Empty:
+            break
+
+
 def init_db():
-    """Initialize the SQLite database with schema, indexes, seeds, and migrations."""
+    """Initialize the SQLite database with schema, indexes, seeds, and migrations.
+
+    Returns the number of ghost jobs reset to idle.
+    """
     try:
         os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
         conn = get_db()
+        journal_mode = conn.execute('PRAGMA journal_mode=WAL').fetchone()[0]
+        if journal_mode.lower() != 'wal':
+            # e.g. a network filesystem without shared-memory support
+            print(f"Warning: WAL unavailable for {DB_PATH}, journal_mode={journal_mode}")
 
-        # Main runs table
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS backup_runs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                job_name TEXT NOT NULL,
-                start_time DATETIME NOT NULL,
-                end_time DATETIME,
-                duration INTEGER,
-                status TEXT NOT NULL,
-                transferred_mb INTEGER DEFAULT 0,
-                percent_complete INTEGER DEFAULT 0,
-                error_message TEXT,
-                log_file TEXT,
-                log_content TEXT
-            )
-        ''')
-
-        # Migration: add log_content if missing
-        try:
-            conn.execute('ALTER TABLE backup_runs ADD COLUMN log_content TEXT')
-        except sqlite3.OperationalError:
-            pass
-
-        # Jobs status table
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS backup_jobs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                job_name TEXT NOT NULL,
-                status TEXT DEFAULT 'idle',
-                last_run DATETIME,
-                next_run DATETIME,
-                pid INTEGER,
-                UNIQUE(job_name)
-            )
-        ''')
-
-        # Compression metrics table
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS backup_metrics (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                run_id INTEGER REFERENCES backup_runs(id),
-                original_size_mb INTEGER,
-                compressed_size_mb INTEGER,
-                compression_ratio REAL,
-                files_count INTEGER,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # Job configuration table
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS job_configs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                job_name TEXT NOT NULL UNIQUE,
-                display_name TEXT NOT NULL,
-                source_path TEXT NOT NULL,
-                dest_path TEXT NOT NULL,
-                mode TEXT NOT NULL DEFAULT 'compression',
-                excludes TEXT DEFAULT '[]',
-                icon_url TEXT DEFAULT '',
-                enabled INTEGER DEFAULT 1,
-                schedule_enabled INTEGER DEFAULT 0,
-                schedule_cron TEXT DEFAULT '',
-                run_group TEXT DEFAULT 'medium',
-                run_order INTEGER DEFAULT 0,
-                retention_count INTEGER DEFAULT 7,
-                backend_type TEXT DEFAULT 'rsync',
-                backend_config TEXT DEFAULT '{}',
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # Migrations: add new columns if missing
-        for col, default in [
-            ('backend_type', "'rsync'"),
-            ('backend_config', "'{}'"),
-        ]:
+        with transaction():
+            # Main runs table
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS backup_runs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_name TEXT NOT NULL,
+                    start_time DATETIME NOT NULL,
+                    end_time DATETIME,
+                    duration INTEGER,
+                    status TEXT NOT NULL,
+                    transferred_mb INTEGER DEFAULT 0,
+                    percent_complete INTEGER DEFAULT 0,
+                    error_message TEXT,
+                    log_file TEXT,
+                    log_content TEXT,
+                    start_ts INTEGER GENERATED ALWAYS AS (CAST(strftime('%s', start_time) AS INTEGER)) VIRTUAL
+                )
+            ''')
+
+            # Migration: add log_content if missing (legacy, logs now live in backup_run_logs)
             try:
-                conn.execute(f'ALTER TABLE job_configs ADD COLUMN {col} TEXT DEFAULT {default}')
+                conn.execute('ALTER TABLE backup_runs ADD COLUMN log_content TEXT')
             except sqlite3.OperationalError:
                 pass
 
-        # Indexes
-        conn.execute('CREATE INDEX IF NOT EXISTS idx_backup_runs_start_time ON backup_runs(start_time DESC)')
-        conn.execute('CREATE INDEX IF NOT EXISTS idx_backup_runs_job_status ON backup_runs(job_name, status)')
-
-        # Seed demo jobs
-        seed_default_jobs(conn)
-
-        # Initialize backup_jobs from job_configs
-        job_configs = conn.execute('SELECT job_name FROM job_configs WHERE enabled = 1').fetchall()
-        all_job_names = ['all'] + [row[0] for row in job_configs]
-        for job_name in all_job_names:
+            # Compressed logs, kept out of backup_runs so scans never page through them
             conn.execute('''
-                INSERT OR IGNORE INTO backup_jobs (job_name, status)
-                VALUES (?, 'idle')
-            ''', (job_name,))
+                CREATE TABLE IF NOT EXISTS backup_run_logs (
+                    run_id INTEGER PRIMARY KEY REFERENCES backup_runs(id),
+                    log_blob BLOB NOT NULL
+                )
+            ''')
+
+            # Migration: move inline logs to backup_run_logs
+            moved = conn.execute('''
+                INSERT OR IGNORE INTO backup_run_logs (run_id, log_blob)
+                SELECT id, log_content FROM backup_runs WHERE log_content IS NOT NULL
+            ''').rowcount
+            if moved > 0:
+                conn.execute('UPDATE backup_runs SET log_content = NULL WHERE log_content IS NOT NULL')
+                print(f"Migrated {moved} log(s) to backup_run_logs")
+
+            # Migration: unix start time computed by SQLite, saves parsing ISO strings in Python
+            try:
+                conn.execute('''
+                    ALTER TABLE backup_runs ADD COLUMN start_ts INTEGER
+                    GENERATED ALWAYS AS (CAST(strftime('%s', start_time) AS INTEGER)) VIRTUAL
+                ''')
+            except sqlite3.OperationalError:
+                pass
 
-        conn.commit()
-        conn.close()
+            # Jobs status table
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS backup_jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_name TEXT NOT NULL,
+                    status TEXT DEFAULT 'idle',
+                    last_run DATETIME,
+                    next_run DATETIME,
+                    pid INTEGER,
+                    UNIQUE(job_name)
+                )
+            ''')
+
+            # Compression metrics table
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS backup_metrics (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    run_id INTEGER REFERENCES backup_runs(id),
+                    original_size_mb INTEGER,
+                    compressed_size_mb INTEGER,
+                    compression_ratio REAL,
+                    files_count INTEGER,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+
+            # Job configuration table
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS job_configs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_name TEXT NOT NULL UNIQUE,
+                    display_name TEXT NOT NULL,
+                    source_path TEXT NOT NULL,
+                    dest_path TEXT NOT NULL,
+                    mode TEXT NOT NULL DEFAULT 'compression',
+                    excludes TEXT DEFAULT '[]',
+                    icon_url TEXT DEFAULT '',
+                    enabled INTEGER DEFAULT 1,
+                    schedule_enabled INTEGER DEFAULT 0,
+                    schedule_cron TEXT DEFAULT '',
+                    run_group TEXT DEFAULT 'medium',
+                    run_order INTEGER DEFAULT 0,
+                    retention_count INTEGER DEFAULT 7,
+                    backend_type TEXT DEFAULT 'rsync',
+                    backend_config TEXT DEFAULT '{}',
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+
+            # Migrations: add new columns if missing
+            for col, default in [
+                ('backend_type', "'rsync'"),
+                ('backend_config', "'{}'"),
+            ]:
+                try:
+                    conn.execute(f'ALTER TABLE job_configs ADD COLUMN {col} TEXT DEFAULT {default}')
+                except sqlite3.OperationalError:
+                    pass
+
+            # Indexes
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_backup_runs_start_time ON backup_runs(start_time DESC)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_backup_runs_job_status ON backup_runs(job_name, status)')
+            existing_indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+            # Covers per-job range scans reading status/duration (weekly report, last run per job)
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_backup_runs_job_start_cover
+                ON backup_runs(job_name, start_time DESC, status, duration)
+            ''')
+            conn.execute('DROP INDEX IF EXISTS idx_backup_runs_job_start')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_backup_metrics_run_id ON backup_metrics(run_id)')
+            # Only unfinished runs; serves log_backup_end's "latest open run of a job" lookup
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_backup_runs_active
+                ON backup_runs(job_name, start_time DESC) WHERE end_time IS NULL
+            ''')
+
+            # Refresh planner statistics once when new indexes are added
+            if not {'idx_backup_runs_job_start_cover', 'idx_backup_metrics_run_id',
+                    'idx_backup_runs_active'} <= existing_indexes:
+                conn.execute('ANALYZE')
+
+            # Seed demo jobs
+            seed_default_jobs(conn)
+
+            # Initialize backup_jobs from job_configs
+            job_configs = conn.execute('SELECT job_name FROM job_configs WHERE enabled = 1').fetchall()
+            all_job_names = ['all'] + [row[0] for row in job_configs]
+            for job_name in all_job_names:
+                conn.execute('''
+                    INSERT OR IGNORE INTO backup_jobs (job_name, status)
+                    VALUES (?, 'idle')
+                ''', (job_name,))
+
+            # Runs left 'running' by a previous process can't be tracked anymore
+            ghost_jobs = conn.execute(
+                "UPDATE backup_jobs SET status = 'idle', pid = NULL WHERE status = 'running'"
+            ).rowcount
+
+        # Seeds and migrations may have written job_configs
+        invalidate_job_config_caches()
         print(f"Database initialized: {DB_PATH}")
+        return ghost_jobs
     except Exception as e:
         print(f"Error init DB: {e}")
+        return 0
 
 
 def seed_default_jobs(conn):
@@ -184,29 +331,56 @@ def seed_default_jobs(conn):
     print(f"Seed: {len(DEMO_SEEDS)} demo jobs inserted (disabled)")
 
 
-def get_job_display_name(job_name):
-    """Get display name for a job from job_configs."""
+# Display names are cached per process. Every write to job_configs must call
+# invalidate_job_config_caches() after committing (see web/jobs.py).
+@functools.lru_cache(maxsize=1)
+def get_all_display_names():
+    """Map of job_name -> display_name for every configured job (shared, don't mutate).
+
+    Errors propagate so a failed query is not cached.
+    """
+    return dict(get_db().execute('SELECT job_name, display_name FROM job_configs').fetchall())
+
+
+def get_job_display_name(job_name, names=None):
+    """Get display name for a job; pass names from get_all_display_names() in loops."""
     if job_name == 'all':
         return 'Full Backup'
     try:
-        conn = sqlite3.connect(DB_PATH)
-        result = conn.execute('SELECT display_name FROM job_configs WHERE job_name = ?', (job_name,)).fetchone()
-        conn.close()
-        if result:
-            return result[0]
+        display_name = (names if names is not None else get_all_display_names()).get(job_name)
+        if display_name is not None:
+            return display_name
     except Exception:
         pass
     return job_name.title()
 
 
+def invalidate_job_config_caches():
+    """Drop caches derived from job_configs after a create/update/delete."""
+    get_all_display_names.cache_clear()
+    _job_config_rows.cache_clear()
+    invalidate_stats_cache()
+
+
+@functools.lru_cache(maxsize=1)
+def _job_config_rows():
+    """All job_configs rows in run order, plus a job_name index (shared, hand out copies).
+
+    Cached like the display names: restore and jobs routes read configs on
+    every request while they only change through the jobs API.
+    """
+    rows = tuple(dict(row) for row in get_db().execute(
+        'SELECT * FROM job_configs ORDER BY run_group, run_order'
+    ))
+    return rows, {row['job_name']: row for row in rows}
+
+
 def get_job_config(job_name):
     """Get full config for a job from job_configs."""
     try:
-        conn = get_db()
-        result = conn.execute('SELECT * FROM job_configs WHERE job_name = ?', (job_name,)).fetchone()
-        conn.close()
-        if result:
-            return dict(result)
+        row = _job_config_rows()[1].get(job_name)
+        if row:
+            return dict(row)
     except Exception as e:
         print(f"Error get_job_config: {e}")
     return None
@@ -215,35 +389,72 @@ def get_job_config(job_name):
 def get_all_job_configs():
     """Get all job configs ordered by run_group and run_order."""
     try:
-        conn = get_db()
-        results = conn.execute('SELECT * FROM job_configs ORDER BY run_group, run_order').fetchall()
-        conn.close()
-        return [dict(row) for row in results]
+        return [dict(row) for row in _job_config_rows()[0]]
     except Exception as e:
         print(f"Error get_all_job_configs: {e}")
         return []
 
 
+_RE_METRICS = re.compile(rb'METRICS:([^:]+):(\d+):(\d+):([\d.]+):(\d+)')
+
+# Stored logs are zstd frames; rows written before the switch hold gzip members
+LOG_ZSTD_LEVEL = 3
+_ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+_GZIP_MAGIC = b'\x1f\x8b'
+
+
+def compress_log(raw):
+    """Compress log bytes for backup_run_logs.log_blob."""
+    return zstandard.ZstdCompressor(level=LOG_ZSTD_LEVEL).compress(raw)
+
+
+def decompress_log_bytes(blob):
+    """Return the raw log bytes of a stored log, whatever codec it was written with."""
+    if isinstance(blob, str):
+        return blob.encode('utf-8')
+    if blob[:4] == _ZSTD_MAGIC:
+        return zstandard.ZstdDecompressor().decompress(blob)
+    if blob[:2] == _GZIP_MAGIC:
+        return gzip.decompress(blob)
+    return bytes(blob)
+
+
+def decompress_log(blob):
+    """Return a stored log as text."""
+    if isinstance(blob, str):
+        return blob
+    return decompress_log_bytes(blob).decode('utf-8', errors='replace')
+
+
+def invalidate_stats_cache():
+    """Drop cached dashboard/metrics aggregates after a write to backup_runs."""
+    from .analytics import get_backup_stats, get_dashboard_aggregates, render_prometheus_metrics
+    from .jobs import get_jobs_overview
+    get_backup_stats.cache_clear()
+    get_dashboard_aggregates.cache_clear()
+    render_prometheus_metrics.cache_clear()
+    get_jobs_overview.cache_clear()
+
+
 def log_backup_start(job_name, log_file, pid=None):
     """Record the start of a backup run."""
     try:
-        conn = sqlite3.connect(DB_PATH)
         local_now = get_local_datetime()
 
-        cursor = conn.execute('''
-            INSERT INTO backup_runs (job_name, start_time, status, log_file)
-            VALUES (?, ?, 'running', ?)
-        ''', (job_name, local_now.isoformat(), os.path.basename(log_file)))
+        with transaction() as conn:
+            cursor = conn.execute('''
+                INSERT INTO backup_runs (job_name, start_time, status, log_file)
+                VALUES (?, ?, 'running', ?)
+            ''', (job_name, local_now.isoformat(), os.path.basename(log_file)))
 
-        run_id = cursor.lastrowid
+            run_id = cursor.lastrowid
 
-        conn.execute('''
-            INSERT OR REPLACE INTO backup_jobs (job_name, status, last_run, pid)
-            VALUES (?, 'running', ?, ?)
-        ''', (job_name, local_now.isoformat(), pid))
+            conn.execute('''
+                INSERT OR REPLACE INTO backup_jobs (job_name, status, last_run, pid)
+                VALUES (?, 'running', ?, ?)
+            ''', (job_name, local_now.isoformat(), pid))
 
-        conn.commit()
-        conn.close()
+        invalidate_stats_cache()
         print(f"Backup {job_name} started at {local_now.strftime('%Y-%m-%d %H:%M:%S')} (run_id: {run_id})")
         return run_id
     except Exception as e:
@@ -251,43 +462,46 @@ def log_backup_start(job_name, log_file, pid=None):
         return None
 
 
-def store_log_content_in_db(run_id, log_file_path):
-    """Store compressed log content in the DB and parse metrics."""
-    try:
-        if not os.path.exists(log_file_path):
-            print(f"Log file not found: {log_file_path}")
-            return
+def store_log_content_in_db(run_id, log_file_path, log_data=None):
+    """Store compressed log content in the DB and parse metrics.
 
-        with open(log_file_path, 'r', encoding='utf-8', errors='ignore') as f:
-            log_content = f.read()
-
-        log_compressed = gzip.compress(log_content.encode('utf-8'))
-        original_size = len(log_content.encode('utf-8'))
+    log_data is the already-read file content; the file is read when omitted.
+    """
+    try:
+        if log_data is None:
+            if not os.path.exists(log_file_path):
+                print(f"Log file not found: {log_file_path}")
+                return
+            with open(log_file_path, 'rb') as f:
+                log_data = f.read()
+
+        log_compressed = compress_log(log_data)
+        original_size = len(log_data)
         compressed_size = len(log_compressed)
         compression_ratio = (compressed_size / original_size * 100) if original_size > 0 else 0
 
         print(f"Log compression: {original_size} -> {compressed_size} bytes ({compression_ratio:.1f}%)")
 
-        conn = sqlite3.connect(DB_PATH)
-
-        conn.execute('''
-            UPDATE backup_runs SET log_content = ? WHERE id = ?
-        ''', (log_compressed, run_id))
-
         # Parse and store compression metrics if present
-        metrics_lines = re.findall(r'METRICS:([^:]+):(\d+):(\d+):([\d.]+):(\d+)', log_content)
+        metrics_lines = _RE_METRICS.findall(log_data)
 
-        for metric in metrics_lines:
-            backup_name, original_mb, compressed_mb, ratio, files_count = metric
+        with transaction() as conn:
             conn.execute('''
+                INSERT OR REPLACE INTO backup_run_logs (run_id, log_blob) VALUES (?, ?)
+            ''', (run_id, log_compressed))
+
+            conn.executemany('''
                 INSERT INTO backup_metrics
                 (run_id, original_size_mb, compressed_size_mb, compression_ratio, files_count)
                 VALUES (?, ?, ?, ?, ?)
-            ''', (run_id, int(original_mb), int(compressed_mb), float(ratio), int(files_count)))
-            print(f"Metrics stored for {backup_name}: {original_mb}MB -> {compressed_mb}MB ({ratio}%)")
+            ''', [
+                (run_id, int(original_mb), int(compressed_mb), float(ratio), int(files_count))
+                for _, original_mb, compressed_mb, ratio, files_count in metrics_lines
+            ])
 
-        conn.commit()
-        conn.close()
+        invalidate_stats_cache()
+        if metrics_lines:
+            print(f"Metrics stored: {len(metrics_lines)} row(s) for run_id {run_id}")
 
         # Delete physical log file after DB storage
         try:
@@ -302,44 +516,67 @@ def store_log_content_in_db(run_id, log_file_path):
         print(f"Error storing log in DB: {e}")
 
 
-def log_backup_end(job_name, status, duration, transferred_mb=0, percent=0, error_msg=None):
-    """Record the end of a backup run with notifications."""
+def load_run_log(run_id):
+    """Return the decompressed log of a run, or None."""
+    if run_id is None:
+        return None
     try:
-        from .notifications import send_whatsapp_notification
+        log_row = get_db().execute(
+            'SELECT log_blob FROM backup_run_logs WHERE run_id = ?', (run_id,)
+        ).fetchone()
+        if log_row:
+            return decompress_log(log_row[0])
+    except Exception as e:
+        print(f"Error retrieving log: {e}")
+    return None
+
+
+def log_backup_end(job_name, status, duration, transferred_mb=0, percent=0, error_msg=None, run_id=None):
+    """Record the end of a backup run with notifications.
+
+    Closes run_id when given, else the job's latest open run.
+    """
+    try:
+        from .notifications import send_whatsapp_notification, WHATSAPP_ENABLED
 
-        conn = sqlite3.connect(DB_PATH)
         local_now = get_local_datetime()
+        tomorrow_4am = (local_now + timedelta(days=1)).replace(hour=4, minute=0, second=0, microsecond=0)
 
-        # Get log content BEFORE updating (for notification)
-        log_content = None
-        try:
-            result = conn.execute('''
-                SELECT log_content FROM backup_runs
-                WHERE job_name = ? AND end_time IS NULL
-                ORDER BY start_time DESC LIMIT 1
-            ''', (job_name,)).fetchone()
-
-            if result and result[0]:
-                log_content = gzip.decompress(result[0]).decode('utf-8')
-        except Exception as e:
-            print(f"Error retrieving log: {e}")
+        with transaction() as conn:
+            # Close the run and get its id in the same statement
+            finished = conn.execute('''
+                UPDATE backup_runs
+                SET end_time = ?, duration = ?, status = ?, transferred_mb = ?,
+                    percent_complete = ?, error_message = ?
+                WHERE id = COALESCE(?, (
+                    SELECT id FROM backup_runs
+                    WHERE job_name = ? AND end_time IS NULL
+                    ORDER BY start_time DESC LIMIT 1
+                )) AND end_time IS NULL
+                RETURNING id
+            ''', (local_now.isoformat(), duration, status, transferred_mb, percent, error_msg,
+                  run_id, job_name)).fetchall()
 
-        # Update the run
-        conn.execute('''
-            UPDATE backup_runs
-            SET end_time = ?, duration = ?, status = ?, transferred_mb = ?,
-                percent_complete = ?, error_message = ?
-            WHERE job_name = ? AND end_time IS NULL
-            ORDER BY start_time DESC LIMIT 1
-        ''', (local_now.isoformat(), duration, status, transferred_mb, percent, error_msg, job_name))
-
-        # Send notifications
+            # Update next run, unless a newer run of the job has started meanwhile
+            conn.execute('''
+                UPDATE backup_jobs SET status = 'idle', next_run = ?, pid = NULL
+                WHERE job_name = ? AND NOT (? IS NOT NULL AND EXISTS (
+                    SELECT 1 FROM backup_runs WHERE job_name = ? AND end_time IS NULL
+                ))
+            ''', (tomorrow_4am.isoformat(), job_name, run_id, job_name))
+
+        invalidate_stats_cache()
+
+        run_id = finished[0][0] if finished else None
+
+        # Notifications go out after commit so the write lock isn't held during HTTP calls.
+        # Only the WhatsApp summary reads the log, so it is loaded only when that channel is on.
         if status == 'error':
             display_name = get_job_display_name(job_name)
             message = f"*Backup failed*\n\nJob: `{display_name}`\nDuration: {duration}s"
             if error_msg:
                 message += f"\nError: `{error_msg[:200]}`"
-            send_whatsapp_notification(message, log_content, job_name)
+            send_whatsapp_notification(message, load_run_log(run_id) if WHATSAPP_ENABLED else None, job_name)
 
         elif status == 'success':
             display_name = get_job_display_name(job_name)
@@ -347,17 +584,11 @@ def log_backup_end(job_name, status, duration, transferred_mb=0, percent=0, erro
             # Get compression ratio
             compression_ratio = None
             try:
-                run_result = conn.execute('''
-                    SELECT id FROM backup_runs
-                    WHERE job_name = ? AND status = 'success'
-                    ORDER BY start_time DESC LIMIT 1
-                ''', (job_name,)).fetchone()
-
-                if run_result:
-                    metrics_result = conn.execute('''
+                if run_id is not None:
+                    metrics_result = get_db().execute('''
                         SELECT compression_ratio FROM backup_metrics
                         WHERE run_id = ? LIMIT 1
-                    ''', (run_result[0],)).fetchone()
+                    ''', (run_id,)).fetchone()
                     if metrics_result:
                         compression_ratio = metrics_result[0]
             except Exception:
@@ -376,32 +607,36 @@ def log_backup_end(job_name, status, duration, transferred_mb=0, percent=0, erro
                 elif transferred_mb > 0:
                     message += f" | {transferred_mb} MB"
 
-            send_whatsapp_notification(message, log_content, job_name)
-
-        # Update next run
-        tomorrow_4am = (local_now + timedelta(days=1)).replace(hour=4, minute=0, second=0, microsecond=0)
-        conn.execute('''
-            UPDATE backup_jobs SET status = 'idle', next_run = ?, pid = NULL WHERE job_name = ?
-        ''', (tomorrow_4am.isoformat(), job_name))
-
-        conn.commit()
-        conn.close()
+            send_whatsapp_notification(message, load_run_log(run_id) if WHATSAPP_ENABLED else None, job_name)
     except Exception as e:
         print(f"Error log_backup_end: {e}")
 
 
+CLEANUP_BATCH_SIZE = 1000
+
+
 def cleanup_old_data():
     """Clean up old data according to retention rules (365 days)."""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        result = conn.execute('''
-            DELETE FROM backup_runs WHERE start_time < datetime('now', '-365 days')
-        ''')
-        deleted = result.rowcount
-        conn.commit()
-        conn.close()
+        deleted = 0
+        # Small transactions keep the WAL bounded and let backups write in between
+        while True:
+            with transaction() as conn:
+                run_ids = conn.execute('''
+                    DELETE FROM backup_runs WHERE id IN (
+                        SELECT id FROM backup_runs WHERE start_time < datetime('now', '-365 days')
+                        LIMIT ?
+                    )
+                    RETURNING id
+                ''', (CLEANUP_BATCH_SIZE,)).fetchall()
+                conn.executemany('DELETE FROM backup_run_logs WHERE run_id = ?', run_ids)
+            deleted += len(run_ids)
+            if len(run_ids) < CLEANUP_BATCH_SIZE:
+                break
+            time.sleep(0.05)
 
         if deleted > 0:
+            invalidate_stats_cache()
             print(f"DB cleanup: {deleted} old runs deleted (> 1 year)")
         return deleted
     except Exception as e:
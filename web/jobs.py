@@ -1,50 +1,82 @@
 """CRUD routes for backup job configurations."""
 
 import json
+import orjson
 from flask import Blueprint, request, jsonify
 
-from .db import DB_PATH, get_all_job_configs, get_job_display_name
+from .db import get_db, transaction, get_all_job_configs, invalidate_job_config_caches
 from .scheduler import get_next_run_for_job, reload_schedules
-from .utils import get_local_datetime
-
-import sqlite3
+from .utils import get_local_datetime, ttl_cache, conditional_response
 
 jobs_bp = Blueprint('jobs', __name__)
 
+JOBS_CACHE_TTL = 3
+
+# Columns api_update_job may set, in a fixed order so the UPDATE text (and its cached plan) repeats
+UPDATABLE_FIELDS = (
+    'display_name', 'source_path', 'dest_path', 'mode', 'icon_url',
+    'enabled', 'run_group', 'run_order', 'retention_count',
+    'backend_type', 'backend_config', 'excludes', 'schedule_enabled', 'schedule_cron',
+)
+
+# JSON-encoded columns and the decoded type serialized on update
+JSON_FIELDS = (('backend_config', dict), ('excludes', list))
+
+# Latest run of every job in one pass over idx_backup_runs_job_start_cover
+LAST_RUN_PER_JOB_SQL = '''
+    SELECT job_name, status, start_time, duration FROM (
+        SELECT job_name, status, start_time, duration,
+               ROW_NUMBER() OVER (PARTITION BY job_name ORDER BY start_time DESC, id DESC) AS rn
+        FROM backup_runs
+    ) WHERE rn = 1
+'''
+
+
+def _canonical_json(value):
+    """Key-order independent bytes for comparing a JSON value or its encoded form."""
+    if isinstance(value, (str, bytes)):
+        try:
+            value = orjson.loads(value)
+        except orjson.JSONDecodeError:
+            return value
+    try:
+        return orjson.dumps(value, option=orjson.OPT_SORT_KEYS)
+    except TypeError:
+        return value
+
+
+@ttl_cache(JOBS_CACHE_TTL)
+def get_jobs_overview():
+    """All job configs with last run status and next scheduled run (cached, cleared on writes)."""
+    jobs = get_all_job_configs()
+    last_runs = {row['job_name']: row for row in get_db().execute(LAST_RUN_PER_JOB_SQL)}
+
+    for job in jobs:
+        last_run = last_runs.get(job['job_name'])
+        if last_run:
+            job['last_status'] = last_run['status']
+            job['last_run_date'] = last_run['start_time']
+            job['last_duration'] = last_run['duration']
+        else:
+            job['last_status'] = 'unknown'
+            job['last_run_date'] = None
+            job['last_duration'] = None
+
+        try:
+            job['excludes'] = orjson.loads(job['excludes']) if isinstance(job['excludes'], str) else job['excludes']
+        except (json.JSONDecodeError, TypeError):
+            job['excludes'] = []
+
+        job['next_run'] = get_next_run_for_job(job['job_name'])
+
+    return jobs
+
 
 @jobs_bp.route('/api/jobs', methods=['GET'])
 def api_get_jobs():
     """List all jobs with config + last run status."""
     try:
-        jobs = get_all_job_configs()
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
-
-        for job in jobs:
-            last_run = conn.execute('''
-                SELECT status, start_time, end_time, duration
-                FROM backup_runs WHERE job_name = ?
-                ORDER BY start_time DESC LIMIT 1
-            ''', (job['job_name'],)).fetchone()
-
-            if last_run:
-                job['last_status'] = last_run['status']
-                job['last_run_date'] = last_run['start_time']
-                job['last_duration'] = last_run['duration']
-            else:
-                job['last_status'] = 'unknown'
-                job['last_run_date'] = None
-                job['last_duration'] = None
-
-            try:
-                job['excludes'] = json.loads(job['excludes']) if isinstance(job['excludes'], str) else job['excludes']
-            except (json.JSONDecodeError, TypeError):
-                job['excludes'] = []
-
-            job['next_run'] = get_next_run_for_job(job['job_name'])
-
-        conn.close()
-        return jsonify({'jobs': jobs})
+        return conditional_response(jsonify({'jobs': get_jobs_overview()}))
     except Exception as e:
         print(f"Error api_get_jobs: {e}")
         return jsonify({'error': str(e)}), 500
@@ -63,37 +95,35 @@ def api_create_job():
             if not data.get(field):
                 return jsonify({'error': f'Missing required field: {field}'}), 400
 
-        conn = sqlite3.connect(DB_PATH)
-
-        existing = conn.execute('SELECT id FROM job_configs WHERE job_name = ?', (data['job_name'],)).fetchone()
-        if existing:
-            conn.close()
-            return jsonify({'error': f'Job "{data["job_name"]}" already exists'}), 409
-
         excludes = json.dumps(data.get('excludes', []))
 
-        conn.execute('''
-            INSERT INTO job_configs (job_name, display_name, source_path, dest_path, mode, excludes,
-                icon_url, run_group, run_order, retention_count, backend_type, backend_config)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            data['job_name'],
-            data['display_name'],
-            data['source_path'],
-            data['dest_path'],
-            data.get('mode', 'compression'),
-            excludes,
-            data.get('icon_url', ''),
-            data.get('run_group', 'medium'),
-            data.get('run_order', 0),
-            data.get('retention_count', 7),
-            data.get('backend_type', 'rsync'),
-            json.dumps(data.get('backend_config', {}))
-        ))
-
-        conn.execute('INSERT OR IGNORE INTO backup_jobs (job_name, status) VALUES (?, ?)', (data['job_name'], 'idle'))
-        conn.commit()
-        conn.close()
+        with transaction() as conn:
+            # UNIQUE(job_name) rejects duplicates; no row comes back when the job already exists
+            created = conn.execute('''
+                INSERT INTO job_configs (job_name, display_name, source_path, dest_path, mode, excludes,
+                    icon_url, run_group, run_order, retention_count, backend_type, backend_config)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(job_name) DO NOTHING
+                RETURNING id
+            ''', (
+                data['job_name'],
+                data['display_name'],
+                data['source_path'],
+                data['dest_path'],
+                data.get('mode', 'compression'),
+                excludes,
+                data.get('icon_url', ''),
+                data.get('run_group', 'medium'),
+                data.get('run_order', 0),
+                data.get('retention_count', 7),
+                data.get('backend_type', 'rsync'),
+                json.dumps(data.get('backend_config', {}))
+            )).fetchall()
+            if not created:
+                return jsonify({'error': f'Job "{data["job_name"]}" already exists'}), 409
+
+            conn.execute('INSERT OR IGNORE INTO backup_jobs (job_name, status) VALUES (?, ?)', (data['job_name'], 'idle'))
+        invalidate_job_config_caches()
 
         return jsonify({'status': 'created', 'job_name': data['job_name']}), 201
     except Exception as e:
@@ -109,40 +139,32 @@ def api_update_job(name):
         if not data:
             return jsonify({'error': 'JSON data required'}), 400
 
-        conn = sqlite3.connect(DB_PATH)
-
-        existing = conn.execute('SELECT id FROM job_configs WHERE job_name = ?', (name,)).fetchone()
-        if not existing:
-            conn.close()
-            return jsonify({'error': f'Job "{name}" not found'}), 404
-
-        fields = {}
-        allowed = ['display_name', 'source_path', 'dest_path', 'mode', 'icon_url',
-                    'enabled', 'run_group', 'run_order', 'retention_count',
-                    'backend_type', 'backend_config']
-        for field in allowed:
-            if field in data:
-                if field == 'backend_config' and isinstance(data[field], dict):
-                    fields[field] = json.dumps(data[field])
-                else:
-                    fields[field] = data[field]
-
-        if 'excludes' in data:
-            fields['excludes'] = json.dumps(data['excludes']) if isinstance(data['excludes'], list) else data['excludes']
-
-        if 'schedule_enabled' in data:
-            fields['schedule_enabled'] = data['schedule_enabled']
-        if 'schedule_cron' in data:
-            fields['schedule_cron'] = data['schedule_cron']
+        fields = {field: data[field] for field in UPDATABLE_FIELDS if field in data}
+
+        with transaction() as conn:
+            existing = conn.execute(
+                'SELECT backend_config, excludes FROM job_configs WHERE job_name = ?', (name,)
+            ).fetchone()
+            if not existing:
+                return jsonify({'error': f'Job "{name}" not found'}), 404
+
+            # Leave JSON columns alone when the client resends what is stored
+            for field, json_type in JSON_FIELDS:
+                if field not in fields:
+                    continue
+                value = fields[field]
+                if _canonical_json(value) == _canonical_json(existing[field]):
+                    del fields[field]
+                elif isinstance(value, json_type):
+                    fields[field] = json.dumps(value)
+
+            if fields:
+                fields['updated_at'] = get_local_datetime().isoformat()
+                set_clause = ', '.join(f'{k} = ?' for k in fields)
+                conn.execute(f'UPDATE job_configs SET {set_clause} WHERE job_name = ?', (*fields.values(), name))
 
         if fields:
-            fields['updated_at'] = get_local_datetime().isoformat()
-            set_clause = ', '.join(f'{k} = ?' for k in fields.keys())
-            values = list(fields.values()) + [name]
-            conn.execute(f'UPDATE job_configs SET {set_clause} WHERE job_name = ?', values)
-            conn.commit()
-
-        conn.close()
+            invalidate_job_config_caches()
 
         if 'schedule_enabled' in data or 'schedule_cron' in data:
             reload_schedules()
@@ -157,16 +179,10 @@ def api_update_job(name):
 def api_delete_job(name):
     """Delete a backup job."""
     try:
-        conn = sqlite3.connect(DB_PATH)
-
-        existing = conn.execute('SELECT id FROM job_configs WHERE job_name = ?', (name,)).fetchone()
-        if not existing:
-            conn.close()
+        deleted = get_db().execute('DELETE FROM job_configs WHERE job_name = ?', (name,)).rowcount
+        if not deleted:
             return jsonify({'error': f'Job "{name}" not found'}), 404
-
-        conn.execute('DELETE FROM job_configs WHERE job_name = ?', (name,))
-        conn.commit()
-        conn.close()
+        invalidate_job_config_caches()
 
         reload_schedules()
 
@@ -1,17 +1,23 @@
 """Notification handlers: WhatsApp, Telegram, Email, weekly report."""
 
+import io
 import os
+import functools
+import re
+import time
 import requests
 import smtplib
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from datetime import datetime, timedelta
-from flask import Blueprint, request, jsonify
-import sqlite3
-import subprocess
+from datetime import timedelta
+from flask import Blueprint, Response, request, jsonify
 
-from .db import DB_PATH, get_job_display_name
-from .utils import get_local_datetime
+from .analytics import get_storage_usage
+from .db import get_db, get_job_display_name
+from .utils import get_local_datetime, parse_iso, conditional_response
 
 notifications_bp = Blueprint('notifications', __name__)
 
@@ -34,10 +40,34 @@ SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD', '')
 SMTP_FROM = os.environ.get('SMTP_FROM', '')
 SMTP_TO = os.environ.get('SMTP_TO', '')
 SMTP_ENABLED = bool(SMTP_USER and SMTP_PASSWORD)
+SMTP_ATTEMPTS = 3
+
+# Report emails requested over HTTP are sent here so the request doesn't wait on SMTP
+MAIL_EXEC = ThreadPoolExecutor(max_workers=2, thread_name_prefix='mail')
 
 # App URL for report footer
 APP_URL = os.environ.get('APP_URL', '')
 
+# Report status dots: no runs, all OK, failures
+_DOT_GREY = '<span style="display:inline-block;width:10px;height:10px;border-radius:50%;background:#6b7280;"></span>'
+_DOT_GREEN = '<span style="display:inline-block;width:10px;height:10px;border-radius:50%;background:#10b981;"></span>'
+_DOT_RED = '<span style="display:inline-block;width:10px;height:10px;border-radius:50%;background:#ef4444;"></span>'
+
+# Shared keep-alive session so each notification skips the TCP/TLS handshake.
+# Gateway errors from the Telegram/WAHA side are retried briefly.
+http_session = requests.Session()
+# Retry only what can't have delivered the message: failed connects and gateway
+# errors. A read timeout or dropped connection may follow an accepted POST.
+_http_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=Retry(
+    total=2, read=0, other=0, backoff_factor=0.3, status_forcelist=[502, 503, 504],
+    allowed_methods=frozenset(['POST'])
+))
+http_session.mount('https://', _http_adapter)
+http_session.mount('http://', _http_adapter)
+
+LOG_SUMMARY_MAX_LINES = 5
+_RE_LOG_PROBLEM = re.compile(r'error|failed', re.IGNORECASE)
+
 
 def extract_log_summary(log_content):
     """Extract key info from log content (compression + files)."""
@@ -46,9 +76,11 @@ def extract_log_summary(log_content):
 
     summary = []
     try:
-        lines = log_content.split('\n')
-        for line in lines:
-            if 'METRICS:' in line:
+        # Walk the log lazily and stop as soon as the summary is full
+        for line in io.StringIO(log_content):
+            if len(summary) >= LOG_SUMMARY_MAX_LINES:
+                break
+            if line.startswith('METRICS:'):
                 parts = line.split(':')
                 if len(parts) >= 6:
                     try:
@@ -59,10 +91,10 @@ def extract_log_summary(log_content):
                         summary.append(f"{original}MB -> {compressed}MB")
                     except Exception:
                         pass
-            elif 'error' in line.lower() or 'failed' in line.lower():
+            elif _RE_LOG_PROBLEM.search(line):
                 summary.append(line.strip()[:100])
 
-        return '\n'.join(summary[:5]) if summary else None
+        return '\n'.join(summary[:LOG_SUMMARY_MAX_LINES]) if summary else None
     except Exception:
         return None
 
@@ -80,7 +112,7 @@ def send_telegram_notification(message, parse_mode='Markdown'):
             'parse_mode': parse_mode,
             'disable_web_page_preview': True
         }
-        response = requests.post(url, json=payload, timeout=10)
+        response = http_session.post(url, json=payload, timeout=10)
         if response.status_code == 200:
             print("Telegram notification sent")
             return True
@@ -114,7 +146,7 @@ def send_whatsapp_notification(message, log_content=None, job_name=None):
             'text': message
         }
 
-        response = requests.post(url, json=payload, headers=headers, timeout=10)
+        response = http_session.post(url, json=payload, headers=headers, timeout=10)
 
         if response.status_code in (200, 201):
             print(f"WhatsApp notification sent{'  with summary' if log_content else ''}")
@@ -133,24 +165,20 @@ def generate_weekly_report_data():
     week_ago = now - timedelta(days=7)
     week_start = week_ago.strftime('%Y-%m-%d %H:%M:%S')
 
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-
-    total_runs = conn.execute(
-        'SELECT COUNT(*) as cnt FROM backup_runs WHERE start_time >= ?', (week_start,)
-    ).fetchone()['cnt']
-    success_runs = conn.execute(
-        'SELECT COUNT(*) as cnt FROM backup_runs WHERE start_time >= ? AND status = ?',
-        (week_start, 'success')
-    ).fetchone()['cnt']
+    conn = get_db()
+
+    # One range scan over idx_backup_runs_start_time for all run totals
+    totals = conn.execute('''
+        SELECT COUNT(*) as cnt,
+               COALESCE(SUM(CASE WHEN status = 'success' THEN 1 ELSE 0 END), 0) as ok,
+               COALESCE(SUM(transferred_mb), 0) as volume
+        FROM backup_runs WHERE start_time >= ?
+    ''', (week_start,)).fetchone()
+    total_runs = totals['cnt']
+    success_runs = totals['ok']
     failed_runs = total_runs - success_runs
     success_rate = round((success_runs / total_runs * 100), 1) if total_runs > 0 else 0
-
-    volume_row = conn.execute(
-        'SELECT COALESCE(SUM(transferred_mb), 0) as total FROM backup_runs WHERE start_time >= ?',
-        (week_start,)
-    ).fetchone()
-    total_volume_mb = volume_row['total']
+    total_volume_mb = totals['volume']
 
     compression_row = conn.execute(
         'SELECT AVG(compression_ratio) as avg_ratio FROM backup_metrics WHERE created_at >= ? AND compression_ratio > 0',
@@ -163,7 +191,6 @@ def generate_weekly_report_data():
             jc.job_name, jc.display_name, jc.icon_url, jc.enabled,
             COUNT(br.id) as runs,
             SUM(CASE WHEN br.status = 'success' THEN 1 ELSE 0 END) as successes,
-            SUM(CASE WHEN br.status != 'success' THEN 1 ELSE 0 END) as failures,
             AVG(br.duration) as avg_duration,
             MAX(br.start_time) as last_run
         FROM job_configs jc
@@ -172,6 +199,16 @@ def generate_weekly_report_data():
         ORDER BY jc.run_order, jc.job_name
     ''', (week_start,)).fetchall()
 
+    # Latest error message of every job that failed this week
+    last_errors = {row['job_name']: row['error_message'] for row in conn.execute('''
+        SELECT job_name, error_message FROM (
+            SELECT job_name, error_message,
+                   ROW_NUMBER() OVER (PARTITION BY job_name ORDER BY start_time DESC, id DESC) AS rn
+            FROM backup_runs
+            WHERE status != 'success' AND start_time >= ?
+        ) WHERE rn = 1
+    ''', (week_start,))}
+
     job_stats = []
     jobs_in_error = []
     jobs_inactive = []
@@ -183,42 +220,30 @@ def generate_weekly_report_data():
             'icon_url': job['icon_url'] or '',
             'runs': job['runs'] or 0,
             'successes': job['successes'] or 0,
-            'failures': job['failures'] or 0,
+            'failures': (job['runs'] or 0) - (job['successes'] or 0),
             'avg_duration': round(job['avg_duration'] / 60, 1) if job['avg_duration'] else 0,
             'last_run': job['last_run'] or 'Never',
         }
         job_stats.append(stat)
 
         if stat['failures'] > 0:
-            err_row = conn.execute('''
-                SELECT error_message FROM backup_runs
-                WHERE job_name = ? AND status != 'success' AND start_time >= ?
-                ORDER BY start_time DESC LIMIT 1
-            ''', (job['job_name'], week_start)).fetchone()
+            error_message = last_errors.get(job['job_name'])
             jobs_in_error.append({
                 **stat,
-                'error_message': err_row['error_message'][:200] if err_row and err_row['error_message'] else 'Unknown error'
+                'error_message': error_message[:200] if error_message else 'Unknown error'
             })
 
         if job['enabled'] and (job['runs'] or 0) == 0:
             jobs_inactive.append(stat)
 
-    # Storage info
-    nas_info = {'used_gb': 0, 'free_gb': 0, 'capacity_gb': 0, 'usage_pct': 0}
-    storage_path = os.environ.get('STORAGE_MOUNT_PATH', '/mnt/data')
-    try:
-        df_output = subprocess.check_output(['df', '-k', storage_path], universal_newlines=True)
-        lines = df_output.strip().split('\n')
-        if len(lines) >= 2:
-            fields = lines[1].split()
-            nas_info['capacity_gb'] = int(fields[1]) // (1024 * 1024)
-            nas_info['used_gb'] = int(fields[2]) // (1024 * 1024)
-            nas_info['free_gb'] = int(fields[3]) // (1024 * 1024)
-            nas_info['usage_pct'] = round(nas_info['used_gb'] / nas_info['capacity_gb'] * 100, 1) if nas_info['capacity_gb'] > 0 else 0
-    except Exception as e:
-        print(f"Report: df error: {e}")
-
-    conn.close()
+    # Storage info, from the dashboard's storage probe
+    usage = get_storage_usage()
+    nas_info = {
+        'used_gb': usage['nas_used_gb'],
+        'free_gb': usage['nas_free_gb'],
+        'capacity_gb': usage['nas_capacity_gb'],
+    }
+    nas_info['usage_pct'] = round(nas_info['used_gb'] / nas_info['capacity_gb'] * 100, 1) if nas_info['capacity_gb'] > 0 else 0
 
     return {
         'period_start': week_ago.strftime('%d/%m/%Y'),
@@ -237,6 +262,14 @@ def generate_weekly_report_data():
     }
 
 
+@functools.lru_cache(maxsize=256)
+def _report_icon_html(icon_url):
+    """Job icon <img> for the report table."""
+    if not icon_url:
+        return ''
+    return f'<img src="{icon_url}" width="20" height="20" style="vertical-align:middle;margin-right:6px;border-radius:4px;" />'
+
+
 def build_report_html(data):
     """Build weekly report HTML (inline CSS for email compatibility)."""
     volume = data['total_volume_mb']
@@ -254,26 +287,26 @@ def build_report_html(data):
     else:
         rate_color = '#ef4444'
 
-    job_rows = ''
+    job_rows = []
     for job in data['job_stats']:
         if job['runs'] == 0:
-            status_dot = '<span style="display:inline-block;width:10px;height:10px;border-radius:50%;background:#6b7280;"></span>'
+            status_dot = _DOT_GREY
         elif job['failures'] == 0:
-            status_dot = '<span style="display:inline-block;width:10px;height:10px;border-radius:50%;background:#10b981;"></span>'
+            status_dot = _DOT_GREEN
         else:
-            status_dot = '<span style="display:inline-block;width:10px;height:10px;border-radius:50%;background:#ef4444;"></span>'
+            status_dot = _DOT_RED
 
-        icon_html = f'<img src="{job["icon_url"]}" width="20" height="20" style="vertical-align:middle;margin-right:6px;border-radius:4px;" />' if job['icon_url'] else ''
+        icon_html = _report_icon_html(job['icon_url'])
 
         last_run = job['last_run']
         if last_run and last_run != 'Never':
+            # Stored start times are ISO strings (with 'T' and offset), which strptime never matched
             try:
-                dt = datetime.strptime(last_run, '%Y-%m-%d %H:%M:%S')
-                last_run = dt.strftime('%d/%m %H:%M')
-            except Exception:
+                last_run = parse_iso(last_run).strftime('%d/%m %H:%M')
+            except ValueError:
                 pass
 
-        job_rows += f'''<tr style="border-bottom:1px solid #2d2d44;">
+        job_rows.append(f'''<tr style="border-bottom:1px solid #2d2d44;">
             <td style="padding:10px 12px;color:#e2e8f0;">{icon_html}{job['display_name']}</td>
             <td style="padding:10px 12px;text-align:center;color:#e2e8f0;">{job['runs']}</td>
             <td style="padding:10px 12px;text-align:center;color:#10b981;">{job['successes']}</td>
@@ -281,26 +314,26 @@ def build_report_html(data):
             <td style="padding:10px 12px;text-align:center;color:#94a3b8;">{job['avg_duration']} min</td>
             <td style="padding:10px 12px;text-align:center;color:#94a3b8;">{last_run}</td>
             <td style="padding:10px 12px;text-align:center;">{status_dot}</td>
-        </tr>'''
+        </tr>''')
+    job_rows = ''.join(job_rows)
 
     alerts_html = ''
     if data['jobs_in_error']:
-        error_items = ''
-        for job in data['jobs_in_error']:
-            error_items += f'''<div style="padding:10px 14px;margin-bottom:8px;background:#3b1c1c;border-left:3px solid #ef4444;border-radius:4px;">
+        error_items = ''.join(f'''<div style="padding:10px 14px;margin-bottom:8px;background:#3b1c1c;border-left:3px solid #ef4444;border-radius:4px;">
                 <strong style="color:#fca5a5;">{job['display_name']}</strong>
                 <span style="color:#94a3b8;"> — {job['failures']} failure(s)</span>
                 <div style="color:#9ca3af;font-size:12px;margin-top:4px;">{job['error_message']}</div>
-            </div>'''
+            </div>''' for job in data['jobs_in_error'])
         alerts_html += f'''<div style="margin-bottom:20px;">
             <h3 style="color:#fca5a5;font-size:16px;margin:0 0 10px;">Jobs in error</h3>
             {error_items}
         </div>'''
 
     if data['jobs_inactive']:
-        inactive_items = ''
-        for job in data['jobs_inactive']:
-            inactive_items += f'<span style="display:inline-block;padding:4px 10px;margin:3px;background:#3b2e1a;color:#fbbf24;border-radius:4px;font-size:13px;">{job["display_name"]}</span>'
+        inactive_items = ''.join(
+            f'<span style="display:inline-block;padding:4px 10px;margin:3px;background:#3b2e1a;color:#fbbf24;border-radius:4px;font-size:13px;">{job["display_name"]}</span>'
+            for job in data['jobs_inactive']
+        )
         alerts_html += f'''<div style="margin-bottom:20px;">
             <h3 style="color:#fbbf24;font-size:16px;margin:0 0 10px;">Inactive jobs (0 runs in 7d)</h3>
             <div>{inactive_items}</div>
@@ -396,11 +429,23 @@ def send_email_report(html, subject):
         msg['From'] = SMTP_FROM
         msg['To'] = SMTP_TO
         msg.attach(MIMEText(html, 'html', 'utf-8'))
+        message = msg.as_string()
 
-        with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30) as server:
-            server.starttls()
-            server.login(SMTP_USER, SMTP_PASSWORD)
-            server.sendmail(SMTP_FROM, SMTP_TO, msg.as_string())
+        for attempt in range(SMTP_ATTEMPTS):
+            try:
+                with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30) as server:
+                    server.starttls()
+                    server.login(SMTP_USER, SMTP_PASSWORD)
+                    server.sendmail(SMTP_FROM, SMTP_TO, message)
+                break
+            except smtplib.SMTPAuthenticationError:
+                raise
+            except (smtplib.SMTPException, OSError) as e:
+                if attempt == SMTP_ATTEMPTS - 1:
+                    raise
+                delay = 2 ** attempt
+                print(f"Email send failed ({e}), retrying in {delay}s")
+                time.sleep(delay)
 
         print(f"Email report sent to {SMTP_TO}")
         return True
@@ -435,14 +480,14 @@ def api_weekly_report():
         html = build_report_html(data)
 
         if request.args.get('preview') == 'true':
-            return html, 200, {'Content-Type': 'text/html; charset=utf-8'}
+            return conditional_response(Response(html, mimetype='text/html'))
 
-        subject = f"Backup Report — Week {data['period_start']} to {data['period_end']}"
-        success = send_email_report(html, subject)
-        if success:
-            return jsonify({'status': 'sent', 'to': SMTP_TO, 'subject': subject})
-        else:
+        if not SMTP_ENABLED:
             return jsonify({'status': 'error', 'message': 'SMTP not configured or send error'}), 500
+
+        subject = f"Backup Report — Week {data['period_start']} to {data['period_end']}"
+        MAIL_EXEC.submit(send_email_report, html, subject)
+        return jsonify({'status': 'queued', 'to': SMTP_TO, 'subject': subject}), 202
     except Exception as e:
         print(f"Error api_weekly_report: {e}")
         return jsonify({'error': str(e)}), 500
@@ -1,20 +1,61 @@
 """Restore routes: list, browse, run, search."""
 
+import io
 import os
+import bisect
+import hashlib
+import re
+import functools
+import itertools
 import json
+import multiprocessing
+import queue
 import threading
+import time
 import subprocess
 import shutil
-import tarfile
+import stat
+import tempfile
+import orjson
 import zstandard
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from datetime import datetime
 from contextlib import contextmanager
 from flask import Blueprint, request, jsonify
 
 from .db import get_job_config, get_all_job_configs
+from .utils import ttl_cache
 
 RCLONE_CONFIG = os.environ.get('RCLONE_CONFIG', '/app/rclone.conf')
 RCLONE_CACHE_DIR = '/tmp/restore/_rclone_cache'
+RCLONE_CACHE_MAX_BYTES = int(os.environ.get('RCLONE_CACHE_MAX_BYTES', str(20 * 1024 ** 3)))
+TAR_INDEX_DIR = '/tmp/restore/_index'
+TAR_INDEX_VERSION = 2
+INDEX_ZSTD_LEVEL = 3
+INDEX_CACHE_SIZE = 8
+DECOMPRESS_WORKERS = os.cpu_count() or 1
+COPY_WORKERS = 16
+EXTRACT_BUFFER_MAX = 1024 * 1024
+# 'python' (parallel in-process copy) or 'rsync' for full direct-mode filesystem restores
+RESTORE_DIRECT_COPY = os.environ.get('RESTORE_DIRECT_COPY', 'python')
+RCLONE_TRANSFERS = 16
+RCLONE_LIST_TTL = 30
+RCLONE_LIST_TIMEOUT = 30
+RCLONE_STREAM_CHUNK = 8 * 1024 * 1024
+PREFETCH_CHUNK = 4 * 1024 * 1024
+PREFETCH_DEPTH = 4
+TAR_STREAM_BUFSIZE = 1024 * 1024
+SEARCH_LIMIT = 50
+SEARCH_DIRECT_LIMIT = 10
+PROGRESS_INTERVAL = 0.1
+SEARCH_WORKERS = int(os.environ.get('RESTORE_SEARCH_WORKERS', str(min(8, (os.cpu_count() or 1) * 2))))
+
+_RE_RCLONE_GLOB = re.compile(r'([\\*?\[\]{}])')
+
+ZSTD_MAGIC = 0xFD2FB528
+# Accept archives written with --long up to zstd's 2 GiB limit
+ZSTD_MAX_WINDOW = 1 << 31
 
 def _rclone_cmd(args, timeout=30):
     """Run rclone command with config."""
@@ -24,12 +65,26 @@ def _rclone_cmd(args, timeout=30):
     )
 
 
+@functools.lru_cache(maxsize=256)
+def _parse_backend_config(raw):
+    """Decoded backend_config, memoized on the raw JSON text. Callers must not mutate it."""
+    return orjson.loads(raw)
+
+
+def _is_within(path, root_real):
+    """True if path resolves to root_real or somewhere below it; root_real must already be a realpath."""
+    try:
+        return os.path.commonpath([os.path.realpath(path), root_real]) == root_real
+    except ValueError:
+        return False
+
+
 def _get_rclone_dest(config):
     """Get rclone remote:path from job config. Returns None if not rclone."""
     if config.get('backend_type') != 'rclone':
         return None
     try:
-        bc = json.loads(config.get('backend_config', '{}'))
+        bc = _parse_backend_config(config.get('backend_config', '{}'))
         remote = bc.get('remote', '')
         path = bc.get('path', '')
         if remote and path:
@@ -46,12 +101,14 @@ def _rclone_download_archive(rclone_dest, filename):
 
     # Reuse cached file if already downloaded
     if os.path.exists(local_path) and os.path.getsize(local_path) > 0:
+        _touch_cached_archive(local_path)
         return local_path
 
     remote_file = f"{rclone_dest}/{filename}"
     try:
         result = _rclone_cmd(['copyto', remote_file, local_path], timeout=60)
         if result.returncode == 0 and os.path.exists(local_path):
+            _evict_rclone_cache(keep=local_path)
             return local_path
         print(f"rclone download failed: {result.stderr}")
     except subprocess.TimeoutExpired:
@@ -65,8 +122,769 @@ def _rclone_download_archive(rclone_dest, filename):
     return None
 
 
+_cache_evict_lock = threading.Lock()
+
+
+def _touch_cached_archive(path):
+    """Mark a cached archive as used; mtime doubles as the LRU stamp since /tmp is often noatime."""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def _evict_rclone_cache(keep=None):
+    """Delete least recently used archives until the cache fits RCLONE_CACHE_MAX_BYTES.
+
+    Only archives count and go: .idx/.trigrams files are small and keep search
+    and browse working without the payload. An archive being extracted stays
+    readable after unlink through its open descriptor.
+    """
+    with _cache_evict_lock:
+        try:
+            with os.scandir(RCLONE_CACHE_DIR) as it:
+                archives = [
+                    (e.stat().st_mtime, e.stat().st_size, e.path) for e in it
+                    if e.name.endswith('.tar.zst') and e.is_file()
+                ]
+        except OSError:
+            return
+        total = sum(size for _, size, _ in archives)
+        for _, size, path in sorted(archives):
+            if total <= RCLONE_CACHE_MAX_BYTES:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+                print(f"rclone cache: evicted {os.path.basename(path)} ({size} bytes)")
+            except OSError:
+                pass
+
+
+@ttl_cache(RCLONE_LIST_TTL, maxsize=256)
+def _rclone_list(dest, limit, *flags):
+    """Parsed `rclone lsf --format sp` as a tuple of (size, name); directory names end with '/'.
+
+    Output is parsed as it streams; with a non-zero limit, rclone is killed once
+    that many entries are in, so capped views never wait for a full listing.
+    Cached for RCLONE_LIST_TTL seconds since the UI repeats the same listings on
+    every click. Raises CalledProcessError when rclone fails.
+    """
+    args = ['rclone', '--config', RCLONE_CONFIG, 'lsf', dest, '--format', 'sp', *flags]
+    entries = []
+    timed_out = threading.Event()
+    with tempfile.TemporaryFile() as err:
+        p = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=err, text=True, bufsize=1 << 20)
+
+        def on_timeout():
+            timed_out.set()
+            p.kill()
+
+        watchdog = threading.Timer(RCLONE_LIST_TIMEOUT, on_timeout)
+        watchdog.start()
+        try:
+            for line in p.stdout:
+                size, sep, name = line.strip().partition(';')
+                if not sep:
+                    continue
+                try:
+                    size = int(size)
+                except ValueError:
+                    size = 0
+                entries.append((size, name.strip()))
+                if limit and len(entries) >= limit:
+                    p.kill()
+                    return tuple(entries)
+        finally:
+            watchdog.cancel()
+            p.stdout.close()
+            returncode = p.wait()
+
+        if timed_out.is_set():
+            raise subprocess.TimeoutExpired(args, RCLONE_LIST_TIMEOUT)
+        if returncode != 0:
+            err.seek(0)
+            raise subprocess.CalledProcessError(returncode, args, stderr=err.read().decode(errors='replace'))
+    return tuple(entries)
+
+
+def invalidate_rclone_listings():
+    """Drop cached rclone listings once a backup may have pushed or pruned archives."""
+    _rclone_list.cache_clear()
+
+
+def _rclone_glob_escape(text):
+    """Escape rclone glob metacharacters so text matches literally."""
+    return _RE_RCLONE_GLOB.sub(r'\\\1', text)
+
+
+def _rclone_selection_filter(paths):
+    """rclone filter rules copying exactly the given paths, files or whole directories."""
+    rules = []
+    for path in paths:
+        path = _rclone_glob_escape(path.strip('/'))
+        # A selection may be a file or a directory; one of the two rules matches
+        rules.append(f"+ /{path}")
+        rules.append(f"+ /{path}/**")
+    rules.append('- **')
+    return '\n'.join(rules) + '\n'
+
+
+def _remote_file_size(rclone_dest, filename):
+    """Size of a remote file from rclone lsf, or None if it cannot be listed."""
+    try:
+        for size, _ in _rclone_list(f"{rclone_dest}/{filename}", 1):
+            return size
+    except subprocess.CalledProcessError as e:
+        print(f"rclone size lookup failed for {filename}: {e.stderr.strip()}")
+    except Exception as e:
+        print(f"rclone size lookup error for {filename}: {e}")
+    return None
+
+
+_index_locks = {}
+_index_locks_guard = threading.Lock()
+
+
+def _index_lock(key):
+    """Per-archive lock so concurrent requests build an index only once."""
+    with _index_locks_guard:
+        return _index_locks.setdefault(key, threading.Lock())
+
+
+def _load_index_file(path):
+    """Parsed (possibly zstd-compressed) JSON file written by _write_json_atomic."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:4] == ZSTD_MAGIC.to_bytes(4, 'little'):
+        with _zstd_dctx() as dctx:
+            data = dctx.decompress(data)
+    try:
+        return orjson.loads(data)
+    except orjson.JSONDecodeError:
+        # Written by json for names with undecodable bytes; see _index_json
+        return json.loads(data)
+
+
+@functools.lru_cache(maxsize=INDEX_CACHE_SIZE)
+def _read_tar_index(index_path, mtime_ns):
+    """Parsed index file; mtime_ns keys the cache so rewritten indexes are reloaded."""
+    return _load_index_file(index_path)
+
+
+# Separate from the index cache so each searched archive costs one slot in each
+@functools.lru_cache(maxsize=INDEX_CACHE_SIZE)
+def _read_trigram_file(path, mtime_ns):
+    """Parsed trigram postings file, keyed like _read_tar_index."""
+    return _load_index_file(path)
+
+
+def _read_exact(fileobj, n):
+    """Read n bytes from a stream that may return short reads; less only at EOF."""
+    data = fileobj.read(n)
+    if len(data) == n or not data:
+        return data
+    chunks = [data]
+    n -= len(data)
+    while n:
+        data = fileobj.read(n)
+        if not data:
+            break
+        chunks.append(data)
+        n -= len(data)
+    return b''.join(chunks)
+
+
+def _skip_exact(fileobj, n, buf):
+    """Discard n bytes of a non-seekable stream through a reusable buffer."""
+    while n:
+        got = fileobj.readinto(buf[:min(n, len(buf))])
+        if not got:
+            return
+        n -= got
+
+
+def _tar_number(field):
+    # Same rules as tarfile.nti: base-256 when the high bit is set, else octal
+    if field[0] in (0o200, 0o377):
+        value = int.from_bytes(field[1:], 'big')
+        return value - (1 << (8 * (len(field) - 1))) if field[0] == 0o377 else value
+    return int(field.split(b'\0', 1)[0].strip() or b'0', 8)
+
+
+def _tar_string(field):
+    return field.split(b'\0', 1)[0].decode('utf-8', 'surrogateescape')
+
+
+def _pax_records(data):
+    """Keyword -> value of a pax extended header ("<len> <key>=<value>\\n" records)."""
+    records = {}
+    pos = 0
+    while pos < len(data):
+        length, sep, _ = data[pos:pos + 20].partition(b' ')
+        if not sep or not length.isdigit():
+            break
+        record = data[pos + len(length) + 1:pos + int(length) - 1]
+        key, _, value = record.partition(b'=')
+        records[key.decode('utf-8', 'replace')] = value.decode('utf-8', 'surrogateescape')
+        pos += int(length)
+    return records
+
+
+def _fast_tar_iter(fileobj):
+    """Yield (name, size, isdir, start, end) per archive member straight from the 512-byte headers.
+
+    Covers what the index needs, ustar prefixes, GNU long names and pax path/size,
+    and reads past payloads without building TarInfo objects. Directory names
+    come without their trailing '/', like tarfile's. start/end delimit the
+    member in the decompressed stream, extension headers included.
+    """
+    skip_buf = memoryview(bytearray(1 << 20))
+    long_name = None
+    pax = {}
+    pos = start = 0
+    while True:
+        header = _read_exact(fileobj, 512)
+        if len(header) < 512 or not header.strip(b'\0'):
+            return
+        pos += 512
+        typeflag = header[156:157]
+        size = _tar_number(header[124:136])
+
+        if typeflag in (b'L', b'K', b'x', b'g'):
+            data = _read_exact(fileobj, (size + 511) & ~511)[:size]
+            pos += (size + 511) & ~511
+            if typeflag == b'L':
+                long_name = _tar_string(data)
+            elif typeflag == b'x':
+                pax = _pax_records(data)
+            # 'K' (long link target) and 'g' (global pax) don't change what we index
+            continue
+
+        if 'path' in pax:
+            name = pax['path']
+        elif long_name is not None:
+            name = long_name
+        else:
+            name = _tar_string(header[0:100])
+            if header[257:263] == b'ustar\0':
+                prefix = _tar_string(header[345:500])
+                if prefix:
+                    name = f"{prefix}/{name}"
+        if 'size' in pax:
+            size = int(pax['size'])
+        padded = (size + 511) & ~511
+        isdir = typeflag == b'5' or (typeflag in (b'0', b'\0') and name.endswith('/'))
+        if isdir:
+            name = name.rstrip('/')
+        # Only regular files carry payload blocks (hard/sym links, dirs and devices don't)
+        has_data = typeflag in (b'0', b'\0', b'7', b'S') and not isdir
+        if has_data:
+            pos += padded
+        yield name, size if has_data else 0, isdir, start, pos
+
+        if has_data:
+            _skip_exact(fileobj, padded, skip_buf)
+        long_name = None
+        pax = {}
+        start = pos
+
+
+def _build_tar_index(fileobj, signature):
+    """Index a decompressed tar stream: member names sorted, with parallel
+    [size, isdir] and [start, end] stream span lists.
+
+    Directory names carry a trailing '/' so browse can bisect on prefixes.
+    """
+    members = sorted(
+        (name + '/' if isdir else name, size, isdir, start, end)
+        for name, size, isdir, start, end in _fast_tar_iter(fileobj)
+    )
+    return {
+        'version': TAR_INDEX_VERSION,
+        'signature': signature,
+        'names': [m[0] for m in members],
+        'meta': [[m[1], m[2]] for m in members],
+        'spans': [[m[3], m[4]] for m in members],
+    }
+
+
+_index_pool = None
+_index_pool_lock = threading.Lock()
+
+
+def _get_index_pool():
+    """Process pool for index builds, started on first use.
+
+    Decompression plus tar header parsing is CPU-bound Python; in a worker
+    process it neither holds the web server's GIL nor queues behind another job.
+    forkserver keeps the workers free of this process's threads and sockets.
+    """
+    global _index_pool
+    with _index_pool_lock:
+        if _index_pool is None:
+            _index_pool = ProcessPoolExecutor(
+                DECOMPRESS_WORKERS, mp_context=multiprocessing.get_context('forkserver')
+            )
+        return _index_pool
+
+
+def _write_tar_index(index_path, signature, open_archive):
+    """Build and store the index and trigram files of one archive (runs in the index pool)."""
+    with open_archive() as stream:
+        index = _build_tar_index(stream, signature)
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    _write_json_atomic(index_path, index)
+    _write_json_atomic(_trigram_path(index_path), {
+        'signature': index['signature'], 'postings': _build_trigrams(index)
+    })
+
+
+def _cached_tar_index(index_path, signature, open_archive):
+    """Load index_path if it matches signature, else rebuild it by reading open_archive().
+
+    open_archive must be picklable (a module-level function or partial) and
+    return a context manager yielding the decompressed tar stream; the build
+    runs in the index pool. A None signature accepts whatever index exists.
+    """
+    with _index_lock(index_path):
+        try:
+            index = _read_tar_index(index_path, os.stat(index_path).st_mtime_ns)
+            if index.get('version') == TAR_INDEX_VERSION and (
+                signature is None or index.get('signature') == signature
+            ):
+                return index
+        except (OSError, ValueError):
+            pass
+
+        _get_index_pool().submit(_write_tar_index, index_path, signature, open_archive).result()
+        return _read_tar_index(index_path, os.stat(index_path).st_mtime_ns)
+
+
+def _index_json(data):
+    """JSON bytes of an index payload.
+
+    Member names that are not valid UTF-8 carry surrogateescape'd bytes,
+    which orjson refuses; json writes them as \\udcXX escapes and reads them
+    back unchanged.
+    """
+    try:
+        return orjson.dumps(data)
+    except TypeError:
+        return json.dumps(data).encode('ascii')
+
+
+def _write_json_atomic(path, data):
+    """Write data as zstd-compressed JSON; member names shrink about tenfold."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(zstandard.ZstdCompressor(level=INDEX_ZSTD_LEVEL).compress(_index_json(data)))
+    os.replace(tmp_path, path)
+
+
+def _trigram_path(index_path):
+    return f"{index_path[:-len('.idx')]}.trigrams"
+
+
+def _name_trigrams(name):
+    return {name[i:i + 3] for i in range(len(name) - 2)}
+
+
+def _build_trigrams(index):
+    """Map each lowercase 3-gram of a file name to the ascending ids of the files containing it."""
+    postings = {}
+    for i, (name, (_, isdir)) in enumerate(zip(index['names'], index['meta'])):
+        if isdir:
+            continue
+        for gram in _name_trigrams(name.lower()):
+            postings.setdefault(gram, []).append(i)
+    return postings
+
+
+def _load_trigrams(index_path, index):
+    """Trigram postings saved next to an index, rebuilt if missing or stale."""
+    path = _trigram_path(index_path)
+    with _index_lock(path):
+        try:
+            data = _read_trigram_file(path, os.stat(path).st_mtime_ns)
+            if data.get('signature') == index['signature']:
+                return data['postings']
+        except (OSError, ValueError, KeyError):
+            pass
+        postings = _build_trigrams(index)
+        _write_json_atomic(path, {'signature': index['signature'], 'postings': postings})
+        return postings
+
+
+def _lowered_names(index):
+    """All member names lowercased into one NUL-joined bytes buffer, plus each name's start offset.
+
+    Built on first search and kept on the (lru-cached) index.
+    """
+    lowered = index.get('_lowered')
+    if lowered is None:
+        names = index['names']
+        joined = '\0'.join(names).lower()
+        if joined.isascii():
+            # Lowercasing kept every length, so offsets come straight from the names (all in C)
+            starts = [0, *itertools.accumulate(map((1).__add__, map(len, names)))]
+            lowered = (joined.encode('ascii'), starts)
+        else:
+            encoded = [name.lower().encode('utf-8', 'surrogateescape') for name in names]
+            starts = [0, *itertools.accumulate(len(name) + 1 for name in encoded)]
+            lowered = (b'\0'.join(encoded), starts)
+        index['_lowered'] = lowered
+    return lowered
+
+
+def _search_tar_index(index_path, index, query_lower, limit):
+    """(name, size) of up to limit files whose name contains query_lower (3+ chars).
+
+    Posting lists of the query's trigrams are intersected, smallest first, and the
+    candidates are checked with bytes.find on the lowered-name buffer. Queries too
+    common for postings to narrow much scan that buffer end to end instead.
+    """
+    names, meta = index['names'], index['meta']
+    blob, starts = _lowered_names(index)
+    needle = query_lower.encode('utf-8', 'surrogateescape')
+    hits = []
+
+    postings = _load_trigrams(index_path, index)
+    lists = sorted((postings.get(gram, ()) for gram in _name_trigrams(query_lower)), key=len)
+    if not lists or not lists[0]:
+        return hits
+
+    if len(lists[0]) > len(names) // 4:
+        # memchr/two-way search in C over every name at once
+        pos = blob.find(needle)
+        while pos >= 0:
+            i = bisect.bisect_right(starts, pos) - 1
+            if not meta[i][1]:
+                hits.append((names[i], meta[i][0]))
+                if len(hits) >= limit:
+                    break
+            pos = blob.find(needle, starts[i + 1])
+        return hits
+
+    candidates = set(lists[0])
+    for ids in lists[1:]:
+        candidates.intersection_update(ids)
+        if not candidates:
+            return hits
+    for i in sorted(candidates):
+        if blob.find(needle, starts[i], starts[i + 1] - 1) >= 0:
+            hits.append((names[i], meta[i][0]))
+            if len(hits) >= limit:
+                break
+    return hits
+
+
+def _get_or_build_tar_index(rclone_dest, filename):
+    """Tar index of a remote archive, cached in RCLONE_CACHE_DIR/{filename}.idx.
+
+    Rebuilt when the remote size changes. Building streams the archive through
+    `rclone cat` without writing it to disk; returns None if that fails.
+    """
+    import tarfile
+    remote_size = _remote_file_size(rclone_dest, filename)
+    open_archive = functools.partial(
+        _open_remote_archive, rclone_dest, filename, os.path.join(RCLONE_CACHE_DIR, filename), remote_size
+    )
+    signature = None if remote_size is None else [remote_size]
+    try:
+        return _cached_tar_index(_remote_index_path(filename), signature, open_archive)
+    except (tarfile.TarError, zstandard.ZstdError, RuntimeError) as e:
+        print(f"rclone index error for {filename}: {e}")
+        return None
+
+
+def _open_remote_archive(rclone_dest, filename, local_path, remote_size):
+    if os.path.exists(local_path):
+        # A copy fetched by an earlier restore saves the transfer, unless the remote changed
+        if remote_size is None or os.path.getsize(local_path) == remote_size:
+            _touch_cached_archive(local_path)
+            return open_zst(local_path, parallel=True)
+        os.remove(local_path)
+    return _rclone_stream_zst(f"{rclone_dest}/{filename}")
+
+
+_dctx_local = threading.local()
+
+
+@contextmanager
+def _zstd_dctx():
+    """A ZstdDecompressor reused across calls on this thread.
+
+    Decompressors are not thread-safe and a stream holds its decompressor
+    until closed, so each thread keeps a free list and nested streams get
+    their own.
+    """
+    free = getattr(_dctx_local, 'free', None)
+    if free is None:
+        free = _dctx_local.free = []
+    dctx = free.pop() if free else zstandard.ZstdDecompressor(max_window_size=ZSTD_MAX_WINDOW)
+    try:
+        yield dctx
+    finally:
+        free.append(dctx)
+
+
+@contextmanager
+def _rclone_stream_zst(remote_file):
+    """Decompressed stream of a remote .tar.zst read straight from `rclone cat`.
+
+    A consumer that reads to the end gets RuntimeError on exit if rclone failed.
+    """
+    with tempfile.TemporaryFile() as err, _zstd_dctx() as dctx:
+        p = subprocess.Popen(
+            ['rclone', '--config', RCLONE_CONFIG, 'cat', remote_file],
+            stdout=subprocess.PIPE, stderr=err
+        )
+        reader = dctx.stream_reader(
+            p.stdout, read_size=RCLONE_STREAM_CHUNK, read_across_frames=True
+        )
+        try:
+            yield reader
+            # Drain the tar padding so rclone exits on its own and its status means something
+            while reader.read(RCLONE_STREAM_CHUNK):
+                pass
+            if p.wait() != 0:
+                err.seek(0)
+                raise RuntimeError(f"rclone cat failed: {err.read().decode(errors='replace').strip()}")
+        finally:
+            reader.close()
+            p.kill()
+            p.wait()
+
+
+def _remote_index_path(filename):
+    return os.path.join(RCLONE_CACHE_DIR, f"{filename}.idx")
+
+
+def _local_index_path(archive_path):
+    real = os.path.realpath(archive_path)
+    key = hashlib.blake2b(real.encode(), digest_size=8).hexdigest()
+    return os.path.join(TAR_INDEX_DIR, f"{key}_{os.path.basename(real)}.idx")
+
+
+def _get_local_tar_index(archive_path):
+    """Tar index of a filesystem archive, rebuilt when its size or mtime changes."""
+    st = os.stat(archive_path)
+    return _cached_tar_index(
+        _local_index_path(archive_path), [st.st_size, st.st_mtime_ns],
+        functools.partial(open_zst, archive_path, parallel=True)
+    )
+
+
+def _list_archive_dir(index, path_param):
+    """Immediate children of path_param, found by bisecting the sorted member names."""
+    names, meta = index['names'], index['meta']
+    entries = []
+    i = bisect.bisect_left(names, path_param)
+    while i < len(names) and len(entries) < 500:
+        name = names[i]
+        if not name.startswith(path_param):
+            break
+        rel = name[len(path_param):]
+        if not rel or rel == '/':
+            i += 1
+            continue
+
+        head, sep, _ = rel.partition('/')
+        if sep:
+            # Explicit directory entry or one implied by a deeper member:
+            # its whole subtree is contiguous, so jump past it
+            dir_path = path_param + head + '/'
+            entries.append({
+                'name': head,
+                'type': 'directory',
+                'size': 0,
+                'path': dir_path
+            })
+            i = bisect.bisect_left(names, dir_path + '\U0010ffff', i)
+        else:
+            entries.append({
+                'name': head,
+                'type': 'file',
+                'size': meta[i][0],
+                'path': name
+            })
+            i += 1
+    return entries
+
+
+def _iter_dir_files(root):
+    """Yield (rel_prefix, entries) per directory under root, entries being its non-directories.
+
+    Directories come in os.walk's top-down order. Like os.walk, symlinked
+    directories are neither listed nor followed, and unreadable directories
+    are skipped. Being a generator, it stops listing as soon as the caller
+    stops iterating.
+    """
+    stack = [(root, '')]
+    while stack:
+        path, prefix = stack.pop()
+        files, subdirs = [], []
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    if not is_dir:
+                        files.append(entry)
+                    elif not entry.is_symlink():
+                        subdirs.append((entry.path, f"{prefix}{entry.name}/"))
+        except OSError:
+            continue
+        if files:
+            yield prefix, files
+        stack.extend(reversed(subdirs))
+
+
+def _collect_copy_pairs(src, dst, pairs, dirs):
+    """Walk src with scandir, queueing (inode, src, dst) per file and creating dst dirs."""
+    dirs.append((src, dst))
+    os.makedirs(dst, exist_ok=True)
+    with os.scandir(src) as it:
+        for entry in it:
+            target = os.path.join(dst, entry.name)
+            if entry.is_dir():
+                _collect_copy_pairs(entry.path, target, pairs, dirs)
+            else:
+                pairs.append((entry.inode(), entry.path, target))
+
+
+def _collect_tree_updates(src, dst, pairs, dirs):
+    """Like _collect_copy_pairs, with `rsync -a` semantics for a full restore.
+
+    Symlinks are recreated rather than followed, special files are skipped,
+    and files whose destination already has the same size and mtime (rsync's
+    quick check) are not queued. A destination entry of another type than the
+    source's is removed first.
+    """
+    dirs.append((src, dst))
+    os.makedirs(dst, exist_ok=True)
+    with os.scandir(src) as it:
+        for entry in it:
+            target = os.path.join(dst, entry.name)
+            if entry.is_symlink():
+                link = os.readlink(entry.path)
+                if _make_way(target, stat.S_ISLNK):
+                    if os.readlink(target) == link:
+                        continue
+                    os.remove(target)
+                os.symlink(link, target)
+            elif entry.is_dir(follow_symlinks=False):
+                _make_way(target, stat.S_ISDIR)
+                _collect_tree_updates(entry.path, target, pairs, dirs)
+            elif entry.is_file(follow_symlinks=False):
+                st = entry.stat(follow_symlinks=False)
+                dst_st = _make_way(target, stat.S_ISREG)
+                if dst_st and dst_st.st_size == st.st_size and int(dst_st.st_mtime) == int(st.st_mtime):
+                    continue
+                pairs.append((st.st_ino, entry.path, target))
+
+
+def _make_way(target, is_kind):
+    """lstat() of target if it is_kind (stat.S_ISDIR, S_ISREG, ...); anything else there is removed.
+
+    Nothing is followed: a symlink to a directory is not a directory here.
+    """
+    try:
+        st = os.lstat(target)
+    except FileNotFoundError:
+        return None
+    if is_kind(st.st_mode):
+        return st
+    if stat.S_ISDIR(st.st_mode):
+        shutil.rmtree(target)
+    else:
+        os.remove(target)
+    return None
+
+
+def _parallel_copy_tree(src, dst, progress=None):
+    """Bring dst up to date with src using COPY_WORKERS concurrent copies. Returns files copied."""
+    pairs, dirs = [], []
+    _collect_tree_updates(src, dst, pairs, dirs)
+    _copy_files(pairs, progress)
+    for src_dir, dst_dir in reversed(dirs):
+        shutil.copystat(src_dir, dst_dir)
+    return len(pairs)
+
+
+def _copy_files(pairs, progress=None):
+    """Copy (inode, src, dst) files with COPY_WORKERS copies in flight, in inode order.
+
+    shutil.copy2 already goes through sendfile on Linux; what costs on many small
+    files is the open/stat/close latency, which overlapping hides.
+    """
+    pairs.sort(key=lambda p: p[0])
+    with ThreadPoolExecutor(COPY_WORKERS, 'restore-copy') as pool:
+        futures = [pool.submit(shutil.copy2, src, dst) for _, src, dst in pairs]
+        for future in futures:
+            future.result()
+            if progress:
+                progress.file_done()
+
+
+class _ProgressThrottle:
+    """restore_progress emitter for one job that coalesces per-file updates.
+
+    State changes go out at once through emit(); file_done() only counts and
+    emits at most every PROGRESS_INTERVAL, so large restores don't send one
+    socketio event per file.
+    """
+
+    def __init__(self, job_name):
+        self.job_name = job_name
+        self.message = ''
+        self.files = 0
+        self.pending = False
+        self.last_emit = 0.0
+
+    def emit(self, status, message):
+        if status == 'running':
+            self.message = message
+            self.files = 0
+        self.pending = False
+        self._send(status, message)
+
+    def file_done(self, n=1):
+        self.files += n
+        self.pending = True
+        if time.monotonic() - self.last_emit >= PROGRESS_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.pending = False
+            self._send('running', f'{self.message} ({self.files} file(s))')
+
+    def tar_filter(self, member, path):
+        """tarfile extraction filter: the 'data' filter, counting each member."""
+        import tarfile
+        member = tarfile.data_filter(member, path)
+        self.file_done()
+        return member
+
+    def _send(self, status, message):
+        self.last_emit = time.monotonic()
+        _get_socketio().emit('restore_progress', {
+            'job_name': self.job_name,
+            'status': status,
+            'message': message
+        })
+
+
 restore_bp = Blueprint('restore', __name__)
 
+SEARCH_EXEC = ThreadPoolExecutor(SEARCH_WORKERS, 'restore-search')
+
 
 def _get_socketio():
     """Lazy import to avoid circular dependency."""
@@ -74,19 +892,385 @@ def _get_socketio():
     return socketio
 
 
+def _zstd_frame_spans(fh):
+    """(offset, size) of every zstd frame in a seekable file, skippable frames left out.
+
+    Only block headers are read, payloads are seeked over. Raises ValueError
+    if the file is not a clean sequence of frames.
+    """
+    end = fh.seek(0, io.SEEK_END)
+    fh.seek(0)
+    spans = []
+    while fh.tell() < end:
+        start = fh.tell()
+        head = fh.read(5)
+        if len(head) < 5:
+            raise ValueError('truncated frame header')
+        magic = int.from_bytes(head[:4], 'little')
+        if magic & 0xFFFFFFF0 == 0x184D2A50:
+            # Skippable frame: 4-byte little-endian length follows the magic
+            length = int.from_bytes(head[4:] + fh.read(3), 'little')
+            fh.seek(start + 8 + length)
+            continue
+        if magic != ZSTD_MAGIC:
+            raise ValueError('not a zstd frame')
+
+        fhd = head[4]
+        single_segment = fhd >> 5 & 1
+        fcs_size = (1 if single_segment else 0, 2, 4, 8)[fhd >> 6]
+        header_rest = (0 if single_segment else 1) + (0, 1, 2, 4)[fhd & 3] + fcs_size
+        fh.seek(header_rest, io.SEEK_CUR)
+
+        while True:
+            block = fh.read(3)
+            if len(block) < 3:
+                raise ValueError('truncated block header')
+            header = int.from_bytes(block, 'little')
+            block_type = header >> 1 & 3
+            if block_type == 3:
+                raise ValueError('reserved block type')
+            # RLE blocks store a single byte whatever their decoded size
+            fh.seek(1 if block_type == 1 else header >> 3, io.SEEK_CUR)
+            if header & 1:
+                break
+        if fhd >> 2 & 1:
+            fh.seek(4, io.SEEK_CUR)
+        if fh.tell() > end:
+            raise ValueError('truncated frame')
+        spans.append((start, fh.tell() - start))
+    return spans
+
+
+def _decompress_frame(data):
+    # decompressobj() copes with frames that don't record their content size
+    with _zstd_dctx() as dctx:
+        return dctx.decompressobj().decompress(data)
+
+
+class _ParallelZstdReader(io.RawIOBase):
+    """Sequential stream over zstd frames decompressed concurrently, in file order."""
+
+    def __init__(self, fh, spans, workers):
+        self._fh = fh
+        self._spans = iter(spans)
+        self._pool = ThreadPoolExecutor(workers, 'zstd')
+        self._pending = deque()
+        self._window = workers * 2
+        self._buf = memoryview(b'')
+        self._fill()
+
+    def _fill(self):
+        # Keep a bounded number of frames in flight so memory stays flat
+        while len(self._pending) < self._window:
+            span = next(self._spans, None)
+            if span is None:
+                return
+            offset, size = span
+            self._fh.seek(offset)
+            self._pending.append(self._pool.submit(_decompress_frame, self._fh.read(size)))
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buf:
+            if not self._pending:
+                return 0
+            self._buf = memoryview(self._pending.popleft().result())
+            self._fill()
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            for future in self._pending:
+                future.cancel()
+            self._pool.shutdown(wait=False)
+        super().close()
+
+
+class _PrefetchReader(io.RawIOBase):
+    """Sequential stream decoded ahead on a background thread.
+
+    python-zstandard drops the GIL while decompressing, so a single-frame
+    archive decodes on one core while the consumer parses tar on another.
+    At most PREFETCH_DEPTH chunks wait in the queue.
+    """
+
+    def __init__(self, reader):
+        self._reader = reader
+        self._queue = queue.Queue(PREFETCH_DEPTH)
+        self._stop = threading.Event()
+        self._buf = memoryview(b'')
+        self._eof = False
+        self._thread = threading.Thread(target=self._produce, name='zstd-prefetch', daemon=True)
+        self._thread.start()
+
+    def _produce(self):
+        try:
+            while not self._stop.is_set():
+                data = self._reader.read(PREFETCH_CHUNK)
+                self._put(data)
+                if not data:
+                    return
+        except Exception as e:
+            self._put(e)
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if not self._buf:
+            if self._eof:
+                return 0
+            item = self._queue.get()
+            if isinstance(item, Exception):
+                raise item
+            if not item:
+                self._eof = True
+                return 0
+            self._buf = memoryview(item)
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._stop.set()
+            self._thread.join()
+            self._reader.close()
+        super().close()
+
+
 @contextmanager
-def open_tar_zst(path):
-    """Open a .tar.zst archive in streaming mode (memory-efficient)."""
-    dctx = zstandard.ZstdDecompressor()
+def open_zst(path, parallel=False):
+    """Decompressed read stream over a .zst file.
+
+    With parallel=True, multi-frame archives (pzstd and friends) are decoded
+    on DECOMPRESS_WORKERS threads, and single-frame archives are decoded
+    ahead on a prefetch thread.
+    """
     fh = open(path, 'rb')
-    reader = dctx.stream_reader(fh)
-    tf = tarfile.open(fileobj=reader, mode='r|')
-    try:
-        yield tf
-    finally:
-        tf.close()
-        reader.close()
-        fh.close()
+    spans = []
+    if parallel and DECOMPRESS_WORKERS > 1:
+        try:
+            spans = _zstd_frame_spans(fh)
+        except ValueError:
+            spans = []
+        fh.seek(0)
+    with _zstd_dctx() as dctx:
+        if len(spans) > 1:
+            reader = _ParallelZstdReader(fh, spans, DECOMPRESS_WORKERS)
+        elif parallel and DECOMPRESS_WORKERS > 1:
+            reader = _PrefetchReader(
+                dctx.stream_reader(fh, read_size=TAR_STREAM_BUFSIZE, read_across_frames=True)
+            )
+        else:
+            reader = dctx.stream_reader(fh, read_size=TAR_STREAM_BUFSIZE, read_across_frames=True)
+        try:
+            yield reader
+        finally:
+            reader.close()
+            fh.close()
+
+
+class _StreamWindow:
+    """Read-only view of the next n bytes of a stream, so tarfile's read-ahead stays inside one member."""
+
+    def __init__(self, fileobj, n):
+        self.fileobj = fileobj
+        self.remaining = n
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = _read_exact(self.fileobj, size) if size else b''
+        self.remaining -= len(data)
+        return data
+
+
+def _write_member(path, data, mode, mtime):
+    """Write one buffered regular file the way tarfile.extract leaves it under the 'data' filter."""
+    with open(path, 'wb') as f:
+        f.write(data)
+    if mode is not None:
+        os.chmod(path, mode)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def _stream_member(src, path, mode, mtime, buf):
+    """Copy a large member's payload through the restore's reusable buffer, then set its attributes."""
+    with open(path, 'wb') as f:
+        while True:
+            n = src.readinto(buf)
+            if not n:
+                break
+            f.write(buf[:n])
+    if mode is not None:
+        os.chmod(path, mode)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+class _MemberWriter:
+    """Writes extracted regular members so file I/O overlaps with decompression.
+
+    Members up to EXTRACT_BUFFER_MAX are read into memory and written by the
+    pool's threads, at most two batches of them in flight; larger ones stream
+    through one reusable buffer on the caller's thread.
+    """
+
+    def __init__(self, pool, target_path, tar_filter):
+        self.pool = pool
+        self.target_path = target_path
+        self.tar_filter = tar_filter
+        self.dest_real = os.path.realpath(target_path)
+        self.made_dirs = set()
+        self.pending = deque()
+        self.inflight = set()
+        self.copy_buf = memoryview(bytearray(1 << 20))
+
+    def filter(self, member):
+        return self.tar_filter(member, self.dest_real)
+
+    def makedirs(self, path):
+        if path not in self.made_dirs:
+            os.makedirs(path, exist_ok=True)
+            self.made_dirs.add(path)
+
+    def write(self, tf, member):
+        src = tf.extractfile(member)
+        member = self.filter(member)
+        dst = os.path.join(self.target_path, member.name)
+        self.makedirs(os.path.dirname(dst))
+        if dst in self.inflight:
+            # A name stored twice must end up as its last copy
+            self.drain()
+        if member.size <= EXTRACT_BUFFER_MAX:
+            self.pending.append((dst, self.pool.submit(_write_member, dst, src.read(), member.mode, member.mtime)))
+            self.inflight.add(dst)
+            if len(self.pending) > COPY_WORKERS * 2:
+                self._finish_one()
+        else:
+            _stream_member(src, dst, member.mode, member.mtime, self.copy_buf)
+
+    def drain(self):
+        while self.pending:
+            self._finish_one()
+
+    def _finish_one(self):
+        dst, future = self.pending.popleft()
+        self.inflight.discard(dst)
+        future.result()
+
+
+def _extract_indexed(archive_path, index, files, target_path, progress=None):
+    """Extract the selected members using the spans stored in the index.
+
+    The archive is still decompressed up to the last selected member, but the
+    members in between are skipped as raw bytes; tarfile only ever sees the
+    headers of the selected ones, and _MemberWriter writes the regular files.
+    Returns the number of members extracted.
+    """
+    import tarfile
+    names, spans = index['names'], index['spans']
+    selected = {}
+    for f in files:
+        for name in (f, f.rstrip('/') + '/'):
+            i = bisect.bisect_left(names, name)
+            j = bisect.bisect_right(names, name, i)
+            if i < j:
+                # A name stored twice unpacks as its last copy, as with tar -x
+                selected[name] = max(spans[i:j])
+                break
+
+    tar_filter = progress.tar_filter if progress else tarfile.data_filter
+    restored = 0
+    skip_buf = memoryview(bytearray(1 << 20))
+    with ThreadPoolExecutor(COPY_WORKERS, 'restore-extract') as pool, \
+            open_zst(archive_path, parallel=True) as stream:
+        writer = _MemberWriter(pool, target_path, tar_filter)
+        pos = 0
+        for start, end in sorted(selected.values()):
+            _skip_exact(stream, start - pos, skip_buf)
+            window = _StreamWindow(stream, end - start)
+            tf = tarfile.open(fileobj=window, mode='r|', bufsize=TAR_STREAM_BUFSIZE)
+            try:
+                member = tf.next()
+                if member is not None and member.isreg():
+                    writer.write(tf, member)
+                    restored += 1
+                elif member is not None:
+                    # Links may point at selected files still being written
+                    writer.drain()
+                    tf.extract(member, target_path, filter=tar_filter)
+                    restored += 1
+            finally:
+                tf.close()
+            _skip_exact(stream, window.remaining, skip_buf)
+            pos = end
+        writer.drain()
+    return restored
+
+
+def _extract_all(archive_path, target_path, progress=None):
+    """Extract a whole .tar.zst like tarfile.extractall with the 'data' filter.
+
+    Regular files go through _MemberWriter, so writing them overlaps with
+    decoding the members that follow. Links and other special members wait
+    for the pending writes, since they may refer to them.
+    """
+    import tarfile
+    tar_filter = progress.tar_filter if progress else tarfile.data_filter
+    directories = []
+    with ThreadPoolExecutor(COPY_WORKERS, 'restore-extract') as pool, \
+            open_tar_zst(archive_path, parallel=True) as tf:
+        writer = _MemberWriter(pool, target_path, tar_filter)
+        for member in tf:
+            if member.isreg():
+                writer.write(tf, member)
+            elif member.isdir():
+                member = writer.filter(member)
+                writer.makedirs(os.path.join(target_path, member.name))
+                directories.append(member)
+            else:
+                writer.drain()
+                tf.extract(member, target_path, filter=tar_filter)
+        writer.drain()
+
+    # As extractall does: directory modes and times last, deepest first
+    for member in sorted(directories, key=lambda m: m.name, reverse=True):
+        path = os.path.join(target_path, member.name)
+        if member.mtime is not None:
+            os.utime(path, (member.mtime, member.mtime))
+        if member.mode is not None:
+            os.chmod(path, member.mode)
+
+
+@contextmanager
+def open_tar_zst(path, parallel=False):
+    """Open a .tar.zst archive in streaming mode (memory-efficient)."""
+    # tarfile is only needed once someone restores; keep it out of app startup
+    import tarfile
+    with open_zst(path, parallel) as reader:
+        # Large reads keep tarfile from pulling the stream 10 KiB at a time
+        tf = tarfile.open(fileobj=reader, mode='r|', bufsize=TAR_STREAM_BUFSIZE)
+        try:
+            yield tf
+        finally:
+            tf.close()
 
 
 @restore_bp.route('/api/restore/list', methods=['GET'])
@@ -116,49 +1300,36 @@ def api_restore_list():
             if rclone_dest:
                 if job['mode'] == 'compression':
                     try:
-                        r = _rclone_cmd(['lsf', rclone_dest, '--include', '*.tar.zst', '--format', 'sp'])
-                        if r.returncode == 0:
-                            archives = []
-                            for line in r.stdout.strip().splitlines():
-                                line = line.strip()
-                                if not line:
-                                    continue
-                                # Format: "size;filename" (--format "sp")
-                                parts = line.split(';', 1)
-                                if len(parts) == 2:
-                                    try:
-                                        size_bytes = int(parts[0])
-                                    except ValueError:
-                                        size_bytes = 0
-                                    fname = parts[1].strip()
-                                    # Extract date from filename pattern: *_YYYYMMDD_HHMMSS.tar.zst
-                                    date_str = ''
-                                    try:
-                                        base = fname.replace('.tar.zst', '')
-                                        date_part = '_'.join(base.split('_')[-2:])
-                                        dt = datetime.strptime(date_part, '%Y%m%d_%H%M%S')
-                                        date_str = dt.isoformat()
-                                    except Exception:
-                                        date_str = ''
-                                    archives.append({
-                                        'filename': fname,
-                                        'size_mb': round(size_bytes / (1024 * 1024), 1),
-                                        'date': date_str
-                                    })
-                            # Sort by filename descending (most recent first)
-                            archives.sort(key=lambda a: a['filename'], reverse=True)
-                            job_info['backups'] = archives
+                        archives = []
+                        for size_bytes, fname in _rclone_list(rclone_dest, 0, '--include', '*.tar.zst'):
+                            # Extract date from filename pattern: *_YYYYMMDD_HHMMSS.tar.zst
+                            date_str = ''
+                            try:
+                                base = fname.replace('.tar.zst', '')
+                                date_part = '_'.join(base.split('_')[-2:])
+                                dt = datetime.strptime(date_part, '%Y%m%d_%H%M%S')
+                                date_str = dt.isoformat()
+                            except Exception:
+                                date_str = ''
+                            archives.append({
+                                'filename': fname,
+                                'size_mb': round(size_bytes / (1024 * 1024), 1),
+                                'date': date_str
+                            })
+                        # Sort by filename descending (most recent first)
+                        archives.sort(key=lambda a: a['filename'], reverse=True)
+                        job_info['backups'] = archives
                     except Exception as e:
                         print(f"rclone list error for {job['job_name']}: {e}")
                 else:
                     # Direct mode: just indicate remote path exists
                     try:
-                        r = _rclone_cmd(['lsf', rclone_dest, '--max-depth', '1', '--dirs-only'])
-                        if r.returncode == 0:
-                            job_info['backups'] = [{
-                                'filename': '(remote direct mirror)',
-                                'date': ''
-                            }]
+                        # Any single entry proves the remote path is there
+                        _rclone_list(rclone_dest, 1, '--max-depth', '1', '--dirs-only')
+                        job_info['backups'] = [{
+                            'filename': '(remote direct mirror)',
+                            'date': ''
+                        }]
                     except Exception as e:
                         print(f"rclone list error for {job['job_name']}: {e}")
 
@@ -166,24 +1337,25 @@ def api_restore_list():
                 continue
 
             # --- rsync/filesystem backend ---
-            if not os.path.exists(dest):
-                result.append(job_info)
-                continue
-
+            # No exists() probe first: a missing dest_path shows up as the scandir/stat error
             if job['mode'] == 'compression':
                 archives = []
-                for f in sorted(os.listdir(dest), reverse=True):
-                    if f.endswith('.tar.zst'):
-                        fpath = os.path.join(dest, f)
-                        try:
-                            stat = os.stat(fpath)
-                            archives.append({
-                                'filename': f,
-                                'size_mb': round(stat.st_size / (1024 * 1024), 1),
-                                'date': datetime.fromtimestamp(stat.st_mtime).isoformat()
-                            })
-                        except Exception:
-                            pass
+                try:
+                    with os.scandir(dest) as it:
+                        entries = [e for e in it if e.name.endswith('.tar.zst')]
+                except FileNotFoundError:
+                    entries = []
+                entries.sort(key=lambda e: e.name, reverse=True)
+                for entry in entries:
+                    try:
+                        st = entry.stat()
+                        archives.append({
+                            'filename': entry.name,
+                            'size_mb': round(st.st_size / (1024 * 1024), 1),
+                            'date': datetime.fromtimestamp(st.st_mtime).isoformat()
+                        })
+                    except Exception:
+                        pass
                 job_info['backups'] = archives
             else:
                 try:
@@ -219,49 +1391,14 @@ def api_restore_browse(job_name):
         # --- rclone backend ---
         if rclone_dest:
             if config['mode'] == 'compression' and file_param:
-                # Download archive to cache, then browse with open_tar_zst
-                local_archive = _rclone_download_archive(rclone_dest, file_param)
-                if not local_archive:
+                # Members come from the cached index; the archive is only fetched to build it
+                index = _get_or_build_tar_index(rclone_dest, file_param)
+                if index is None:
                     return jsonify({'error': 'Failed to download archive from remote'}), 500
 
-                with open_tar_zst(local_archive) as tf:
-                    if path_param and not path_param.endswith('/'):
-                        path_param += '/'
-
-                    seen_dirs = set()
-                    for member in tf:
-                        name = member.name
-                        if member.isdir() and not name.endswith('/'):
-                            name += '/'
-
-                        if path_param and not name.startswith(path_param):
-                            continue
-
-                        rel = name[len(path_param):] if path_param else name
-                        if not rel or rel == '/':
-                            continue
-
-                        parts = rel.rstrip('/').split('/')
-                        if len(parts) == 1 and not member.isdir():
-                            entries.append({
-                                'name': parts[0],
-                                'type': 'file',
-                                'size': member.size,
-                                'path': name
-                            })
-                        elif len(parts) >= 1 and (member.isdir() or len(parts) > 1):
-                            dir_name = parts[0]
-                            if dir_name not in seen_dirs:
-                                seen_dirs.add(dir_name)
-                                entries.append({
-                                    'name': dir_name,
-                                    'type': 'directory',
-                                    'size': 0,
-                                    'path': path_param + dir_name + '/'
-                                })
-
-                        if len(entries) >= 500:
-                            break
+                if path_param and not path_param.endswith('/'):
+                    path_param += '/'
+                entries = _list_archive_dir(index, path_param)
 
             elif config['mode'] == 'direct':
                 # List remote directory contents with rclone lsf
@@ -269,31 +1406,19 @@ def api_restore_browse(job_name):
                 # Remove trailing slash for rclone
                 subpath = subpath.rstrip('/')
                 try:
-                    r = _rclone_cmd(['lsf', subpath, '--format', 'sp', '--max-depth', '1'])
-                    if r.returncode != 0:
-                        return jsonify({'error': f'Remote path not found: {r.stderr.strip()}'}), 404
-
-                    for line in r.stdout.strip().splitlines():
-                        line = line.strip()
-                        if not line:
-                            continue
-                        parts = line.split(';', 1)
-                        if len(parts) == 2:
-                            try:
-                                size_bytes = int(parts[0])
-                            except ValueError:
-                                size_bytes = 0
-                            name = parts[1].strip()
-                            is_dir = name.endswith('/')
-                            clean_name = name.rstrip('/')
-                            entries.append({
-                                'name': clean_name,
-                                'type': 'directory' if is_dir else 'file',
-                                'size': 0 if is_dir else size_bytes,
-                                'path': os.path.join(path_param, clean_name) + ('/' if is_dir else '')
-                            })
-                            if len(entries) >= 500:
-                                break
+                    for size_bytes, name in _rclone_list(subpath, 500, '--max-depth', '1'):
+                        is_dir = name.endswith('/')
+                        clean_name = name.rstrip('/')
+                        entries.append({
+                            'name': clean_name,
+                            'type': 'directory' if is_dir else 'file',
+                            'size': 0 if is_dir else size_bytes,
+                            'path': os.path.join(path_param, clean_name) + ('/' if is_dir else '')
+                        })
+                        if len(entries) >= 500:
+                            break
+                except subprocess.CalledProcessError as e:
+                    return jsonify({'error': f'Remote path not found: {e.stderr.strip()}'}), 404
                 except Exception as e:
                     return jsonify({'error': f'rclone browse error: {e}'}), 500
 
@@ -308,54 +1433,19 @@ def api_restore_browse(job_name):
         # --- rsync/filesystem backend ---
         if config['mode'] == 'compression' and file_param:
             archive_path = os.path.join(config['dest_path'], file_param)
-            if not os.path.realpath(archive_path).startswith(os.path.realpath(config['dest_path'])):
+            if not _is_within(archive_path, os.path.realpath(config['dest_path'])):
                 return jsonify({'error': 'Unauthorized path'}), 403
 
             if not os.path.exists(archive_path):
                 return jsonify({'error': 'Archive not found'}), 404
 
-            with open_tar_zst(archive_path) as tf:
-                if path_param and not path_param.endswith('/'):
-                    path_param += '/'
-
-                seen_dirs = set()
-                for member in tf:
-                    name = member.name
-                    if member.isdir() and not name.endswith('/'):
-                        name += '/'
-
-                    if path_param and not name.startswith(path_param):
-                        continue
-
-                    rel = name[len(path_param):] if path_param else name
-                    if not rel or rel == '/':
-                        continue
-
-                    parts = rel.rstrip('/').split('/')
-                    if len(parts) == 1 and not member.isdir():
-                        entries.append({
-                            'name': parts[0],
-                            'type': 'file',
-                            'size': member.size,
-                            'path': name
-                        })
-                    elif len(parts) >= 1 and (member.isdir() or len(parts) > 1):
-                        dir_name = parts[0]
-                        if dir_name not in seen_dirs:
-                            seen_dirs.add(dir_name)
-                            entries.append({
-                                'name': dir_name,
-                                'type': 'directory',
-                                'size': 0,
-                                'path': path_param + dir_name + '/'
-                            })
-
-                    if len(entries) >= 500:
-                        break
+            if path_param and not path_param.endswith('/'):
+                path_param += '/'
+            entries = _list_archive_dir(_get_local_tar_index(archive_path), path_param)
 
         elif config['mode'] == 'direct':
             browse_path = os.path.join(config['dest_path'], path_param)
-            if not os.path.realpath(browse_path).startswith(os.path.realpath(config['dest_path'])):
+            if not _is_within(browse_path, os.path.realpath(config['dest_path'])):
                 return jsonify({'error': 'Unauthorized path'}), 403
 
             if not os.path.exists(browse_path):
@@ -418,65 +1508,48 @@ def api_restore_run():
         os.makedirs(target_path, exist_ok=True)
 
         def do_restore():
+            progress = _ProgressThrottle(job_name)
             try:
-                _get_socketio().emit('restore_progress', {
-                    'job_name': job_name,
-                    'status': 'running',
-                    'message': f'Restoring {job_name}...'
-                })
+                progress.emit('running', f'Restoring {job_name}...')
 
                 # --- rclone backend ---
                 if rclone_dest:
                     if config['mode'] == 'compression' and backup_file:
                         # Download archive to cache, then extract
-                        _get_socketio().emit('restore_progress', {
-                            'job_name': job_name,
-                            'status': 'running',
-                            'message': f'Downloading archive from remote...'
-                        })
+                        progress.emit('running', f'Downloading archive from remote...')
                         local_archive = _rclone_download_archive(rclone_dest, backup_file)
                         if not local_archive:
                             raise RuntimeError('Failed to download archive from remote')
 
-                        _get_socketio().emit('restore_progress', {
-                            'job_name': job_name,
-                            'status': 'running',
-                            'message': f'Extracting archive...'
-                        })
-                        with open_tar_zst(local_archive) as tf:
-                            if files:
-                                files_set = set(files)
-                                restored = 0
-                                for member in tf:
-                                    if member.name in files_set:
-                                        tf.extract(member, target_path, filter='data')
-                                        restored += 1
-                                        if restored >= len(files_set):
-                                            break
-                                msg = f'{restored} file(s) restored from remote archive'
-                            else:
-                                tf.extractall(target_path, filter='data')
-                                msg = 'Full restore completed from remote archive'
+                        progress.emit('running', f'Extracting archive...')
+                        if files:
+                            # Browsing built the index; a restore without one pays a single indexing pass
+                            index = _get_or_build_tar_index(rclone_dest, backup_file)
+                            if not index:
+                                raise RuntimeError('Failed to index remote archive')
+                            restored = _extract_indexed(local_archive, index, files, target_path, progress)
+                            msg = f'{restored} file(s) restored from remote archive'
+                        else:
+                            _extract_all(local_archive, target_path, progress)
+                            msg = 'Full restore completed from remote archive'
 
                     elif config['mode'] == 'direct':
                         # Use rclone copy to restore from remote
                         if files:
-                            restored = 0
-                            for f in files:
-                                remote_file = f"{rclone_dest}/{f}"
-                                dst_file = os.path.join(target_path, f)
-                                os.makedirs(os.path.dirname(dst_file), exist_ok=True)
-                                try:
-                                    r = _rclone_cmd(['copyto', remote_file, dst_file], timeout=60)
-                                    if r.returncode == 0:
-                                        restored += 1
-                                    else:
-                                        # Try as directory
-                                        r = _rclone_cmd(['copy', remote_file, dst_file], timeout=60)
-                                        if r.returncode == 0:
-                                            restored += 1
-                                except Exception as e:
-                                    print(f"rclone restore file error {f}: {e}")
+                            # One rclone run for the whole selection; rclone parallelizes the transfers
+                            fd, filter_path = tempfile.mkstemp(suffix='.filter')
+                            try:
+                                with os.fdopen(fd, 'w') as fh:
+                                    fh.write(_rclone_selection_filter(files))
+                                r = _rclone_cmd([
+                                    'copy', rclone_dest, target_path, '--filter-from', filter_path,
+                                    '--transfers', str(RCLONE_TRANSFERS), '--checkers', str(RCLONE_TRANSFERS)
+                                ], timeout=60 * len(files))
+                            finally:
+                                os.remove(filter_path)
+                            if r.returncode != 0:
+                                raise RuntimeError(f'rclone copy failed: {r.stderr.strip()}')
+                            restored = sum(os.path.exists(os.path.join(target_path, f)) for f in files)
                             msg = f'{restored} file(s) restored from remote'
                         else:
                             r = _rclone_cmd(['copy', rclone_dest, target_path], timeout=60)
@@ -489,60 +1562,61 @@ def api_restore_run():
                 # --- rsync/filesystem backend ---
                 elif config['mode'] == 'compression' and backup_file:
                     archive_path = os.path.join(config['dest_path'], backup_file)
-                    if not os.path.realpath(archive_path).startswith(os.path.realpath(config['dest_path'])):
+                    if not _is_within(archive_path, os.path.realpath(config['dest_path'])):
                         raise ValueError('Unauthorized archive path')
 
-                    with open_tar_zst(archive_path) as tf:
-                        if files:
-                            files_set = set(files)
-                            restored = 0
-                            for member in tf:
-                                if member.name in files_set:
-                                    tf.extract(member, target_path, filter='data')
-                                    restored += 1
-                                    if restored >= len(files_set):
-                                        break
-                            msg = f'{restored} file(s) restored'
-                        else:
-                            tf.extractall(target_path, filter='data')
-                            msg = 'Full restore completed'
+                    if files:
+                        restored = _extract_indexed(
+                            archive_path, _get_local_tar_index(archive_path), files, target_path, progress
+                        )
+                        msg = f'{restored} file(s) restored'
+                    else:
+                        _extract_all(archive_path, target_path, progress)
+                        msg = 'Full restore completed'
 
                 elif config['mode'] == 'direct':
                     src = config['dest_path']
                     if files:
+                        src_real = os.path.realpath(src)
+                        pairs, dirs = [], []
+                        made_dirs = set()
                         for f in files:
                             src_file = os.path.join(src, f)
                             dst_file = os.path.join(target_path, f)
-                            if not os.path.realpath(src_file).startswith(os.path.realpath(src)):
+                            # Still one realpath per file: a symlink inside src may point out of it
+                            if not _is_within(src_file, src_real):
                                 continue
-                            os.makedirs(os.path.dirname(dst_file), exist_ok=True)
-                            if os.path.isdir(src_file):
-                                shutil.copytree(src_file, dst_file, dirs_exist_ok=True)
+                            parent = os.path.dirname(dst_file)
+                            if parent not in made_dirs:
+                                os.makedirs(parent, exist_ok=True)
+                                made_dirs.add(parent)
+                            st = os.stat(src_file)
+                            if stat.S_ISDIR(st.st_mode):
+                                _collect_copy_pairs(src_file, dst_file, pairs, dirs)
                             else:
-                                shutil.copy2(src_file, dst_file)
+                                pairs.append((st.st_ino, src_file, dst_file))
+                        _copy_files(pairs, progress)
+                        # Directory times last, as copytree does, once their contents are written
+                        for src_dir, dst_dir in reversed(dirs):
+                            shutil.copystat(src_dir, dst_dir)
                         msg = f'{len(files)} file(s) restored'
-                    else:
+                    elif RESTORE_DIRECT_COPY == 'rsync':
                         subprocess.run(
                             ['rsync', '-av', '--no-owner', '--no-group', f'{src}/', f'{target_path}/'],
                             check=True, capture_output=True, text=True
                         )
                         msg = 'Full restore completed (rsync)'
+                    else:
+                        copied = _parallel_copy_tree(src, target_path, progress)
+                        msg = f'Full restore completed ({copied} file(s) copied)'
                 else:
                     msg = 'Unsupported mode'
 
-                _get_socketio().emit('restore_progress', {
-                    'job_name': job_name,
-                    'status': 'success',
-                    'message': msg
-                })
+                progress.emit('success', msg)
                 print(f"Restore: {msg} for {job_name} -> {target_path}")
 
             except Exception as e:
-                _get_socketio().emit('restore_progress', {
-                    'job_name': job_name,
-                    'status': 'error',
-                    'message': str(e)
-                })
+                progress.emit('error', str(e))
                 print(f"Restore thread error: {e}")
 
         restore_thread = threading.Thread(target=do_restore, daemon=True)
@@ -558,160 +1632,182 @@ def api_restore_run():
         return jsonify({'error': str(e)}), 500
 
 
-@restore_bp.route('/api/restore/search', methods=['GET'])
-def api_restore_search():
-    """Search for a file across all backups."""
+def _search_tasks(job, query, query_lower):
+    """Independent search units for one job, in display order.
+
+    Local archives are one unit each so they are looked up side by side;
+    everything else searches as a whole job.
+    """
+    if not _get_rclone_dest(job) and job['mode'] == 'compression':
+        return [functools.partial(_search_local_archive, job, name, query_lower)
+                for name in _local_search_archives(job)]
+    return [functools.partial(_search_job, job, query, query_lower)]
+
+
+def _local_search_archives(job):
+    """The filesystem archives a search covers: the job's three newest."""
     try:
-        query = request.args.get('q', '').strip()
-        if len(query) < 3:
-            return jsonify({'error': 'Minimum 3 characters'}), 400
+        names = os.listdir(job['dest_path'])
+    except FileNotFoundError:
+        return []
+    return sorted([f for f in names if f.endswith('.tar.zst')], reverse=True)[:3]
 
-        query_lower = query.lower()
-        results = []
-        jobs = get_all_job_configs()
 
-        for job in jobs:
-            if not job.get('enabled'):
-                continue
+def warm_search_indexes(job_name):
+    """Index a job's searchable local archives in the background once a backup wrote a new one."""
+    SEARCH_EXEC.submit(_warm_search_indexes, job_name)
 
-            rclone_dest = _get_rclone_dest(job)
 
-            # --- rclone backend ---
-            if rclone_dest:
-                if job['mode'] == 'compression':
-                    # List remote archives, download the most recent, then scan
-                    try:
-                        r = _rclone_cmd(['lsf', rclone_dest, '--include', '*.tar.zst'])
-                        if r.returncode != 0:
-                            continue
-                        remote_archives = sorted(r.stdout.strip().splitlines(), reverse=True)[:1]
-                        for archive_name in remote_archives:
-                            archive_name = archive_name.strip()
-                            if not archive_name:
-                                continue
-                            local_archive = _rclone_download_archive(rclone_dest, archive_name)
-                            if not local_archive:
-                                continue
-                            try:
-                                with open_tar_zst(local_archive) as tf:
-                                    for member in tf:
-                                        if member.isdir():
-                                            continue
-                                        if query_lower in member.name.lower():
-                                            results.append({
-                                                'job_name': job['job_name'],
-                                                'display_name': job['display_name'],
-                                                'backup_file': archive_name,
-                                                'file_path': member.name,
-                                                'size': member.size,
-                                                'mode': 'compression'
-                                            })
-                                            if len(results) >= 50:
-                                                break
-                            except Exception:
-                                pass
-                            if len(results) >= 50:
-                                break
-                    except Exception as e:
-                        print(f"rclone search error for {job['job_name']}: {e}")
+def _warm_search_indexes(job_name):
+    try:
+        job = get_job_config(job_name)
+        if not job or job['mode'] != 'compression' or _get_rclone_dest(job):
+            return
+        for archive_name in _local_search_archives(job):
+            archive_path = os.path.join(job['dest_path'], archive_name)
+            index = _get_local_tar_index(archive_path)
+            _load_trigrams(_local_index_path(archive_path), index)
+            _lowered_names(index)
+    except Exception as e:
+        print(f"Search index warm-up error for {job_name}: {e}")
+
 
-                elif job['mode'] == 'direct':
-                    # Use rclone lsf recursive to search remote directory
+def _search_local_archive(job, archive_name, query_lower):
+    """Search one filesystem archive through its index; at most SEARCH_LIMIT results."""
+    archive_path = os.path.join(job['dest_path'], archive_name)
+    try:
+        index = _get_local_tar_index(archive_path)
+        hits = _search_tar_index(_local_index_path(archive_path), index, query_lower, SEARCH_LIMIT)
+    except Exception:
+        hits = []
+    return [{
+        'job_name': job['job_name'],
+        'display_name': job['display_name'],
+        'backup_file': archive_name,
+        'file_path': name,
+        'size': size,
+        'mode': 'compression'
+    } for name, size in hits]
+
+
+def _search_job(job, query, query_lower):
+    """Search one job's latest backups (local archives excepted, see _search_tasks);
+    at most SEARCH_LIMIT results, in display order."""
+    results = []
+    rclone_dest = _get_rclone_dest(job)
+
+    # --- rclone backend ---
+    if rclone_dest:
+        if job['mode'] == 'compression':
+            # List remote archives, index the most recent, then look it up
+            try:
+                listing = _rclone_list(rclone_dest, 0, '--include', '*.tar.zst')
+                remote_archives = sorted((name for _, name in listing), reverse=True)[:1]
+                for archive_name in remote_archives:
                     try:
-                        r = _rclone_cmd(['lsf', rclone_dest, '--recursive', '--format', 'sp', '--files-only'])
-                        if r.returncode == 0:
-                            count = 0
-                            for line in r.stdout.strip().splitlines():
-                                line = line.strip()
-                                if not line:
-                                    continue
-                                parts = line.split(';', 1)
-                                if len(parts) == 2:
-                                    try:
-                                        size_bytes = int(parts[0])
-                                    except ValueError:
-                                        size_bytes = 0
-                                    fpath = parts[1].strip()
-                                    fname = os.path.basename(fpath)
-                                    if query_lower in fname.lower():
-                                        results.append({
-                                            'job_name': job['job_name'],
-                                            'display_name': job['display_name'],
-                                            'backup_file': '',
-                                            'file_path': fpath,
-                                            'size': size_bytes,
-                                            'mode': 'direct'
-                                        })
-                                        count += 1
-                                        if count >= 10 or len(results) >= 50:
-                                            break
-                    except Exception as e:
-                        print(f"rclone search error for {job['job_name']}: {e}")
+                        index = _get_or_build_tar_index(rclone_dest, archive_name)
+                    except Exception:
+                        index = None
+                    if not index:
+                        continue
+                    hits = _search_tar_index(
+                        _remote_index_path(archive_name), index, query_lower, SEARCH_LIMIT - len(results)
+                    )
+                    for name, size in hits:
+                        results.append({
+                            'job_name': job['job_name'],
+                            'display_name': job['display_name'],
+                            'backup_file': archive_name,
+                            'file_path': name,
+                            'size': size,
+                            'mode': 'compression'
+                        })
+                    if len(results) >= SEARCH_LIMIT:
+                        break
+            except Exception as e:
+                print(f"rclone search error for {job['job_name']}: {e}")
 
-                if len(results) >= 50:
-                    break
-                continue
+        elif job['mode'] == 'direct':
+            # Let rclone filter names remotely; only matches cross the wire
+            try:
+                pattern = f"*{_rclone_glob_escape(query)}*"
+                listing = _rclone_list(
+                    rclone_dest, SEARCH_LIMIT, '--recursive', '--files-only', '--fast-list',
+                    '--include', pattern, '--ignore-case'
+                )
+                for size_bytes, fpath in listing:
+                    fname = os.path.basename(fpath)
+                    # Safety net: rclone glob and Python substring rules differ at the edges
+                    if query_lower in fname.lower():
+                        results.append({
+                            'job_name': job['job_name'],
+                            'display_name': job['display_name'],
+                            'backup_file': '',
+                            'file_path': fpath,
+                            'size': size_bytes,
+                            'mode': 'direct'
+                        })
+                        if len(results) >= SEARCH_DIRECT_LIMIT:
+                            break
+            except Exception as e:
+                print(f"rclone search error for {job['job_name']}: {e}")
 
-            # --- rsync/filesystem backend ---
-            if not os.path.exists(job['dest_path']):
+        return results
+
+    # --- rsync/filesystem backend ---
+    if not os.path.exists(job['dest_path']):
+        return results
+
+    if job['mode'] == 'direct':
+        for prefix, entries in _iter_dir_files(job['dest_path']):
+            # One lower() per directory rules out most of them without touching each name
+            if query_lower not in '\0'.join(e.name for e in entries).lower():
                 continue
+            for entry in entries:
+                if query_lower not in entry.name.lower():
+                    continue
+                try:
+                    fsize = entry.stat().st_size
+                except OSError:
+                    fsize = 0
+                results.append({
+                    'job_name': job['job_name'],
+                    'display_name': job['display_name'],
+                    'backup_file': '',
+                    'file_path': prefix + entry.name,
+                    'size': fsize,
+                    'mode': 'direct'
+                })
+                if len(results) >= SEARCH_DIRECT_LIMIT:
+                    return results
 
-            if job['mode'] == 'compression':
-                archives = sorted(
-                    [f for f in os.listdir(job['dest_path']) if f.endswith('.tar.zst')],
-                    reverse=True
-                )[:3]
+    return results
 
-                for archive_name in archives:
-                    archive_path = os.path.join(job['dest_path'], archive_name)
-                    try:
-                        with open_tar_zst(archive_path) as tf:
-                            for member in tf:
-                                if member.isdir():
-                                    continue
-                                if query_lower in member.name.lower():
-                                    results.append({
-                                        'job_name': job['job_name'],
-                                        'display_name': job['display_name'],
-                                        'backup_file': archive_name,
-                                        'file_path': member.name,
-                                        'size': member.size,
-                                        'mode': 'compression'
-                                    })
-                                    if len(results) >= 50:
-                                        break
-                    except Exception:
-                        pass
 
-                    if len(results) >= 50:
-                        break
+@restore_bp.route('/api/restore/search', methods=['GET'])
+def api_restore_search():
+    """Search for a file across all backups."""
+    try:
+        query = request.args.get('q', '').strip()
+        if len(query) < 3:
+            return jsonify({'error': 'Minimum 3 characters'}), 400
 
-            elif job['mode'] == 'direct':
-                count = 0
-                for root, dirs, files_list in os.walk(job['dest_path']):
-                    for f in files_list:
-                        if query_lower in f.lower():
-                            rel_path = os.path.relpath(os.path.join(root, f), job['dest_path'])
-                            try:
-                                fsize = os.path.getsize(os.path.join(root, f))
-                            except Exception:
-                                fsize = 0
-                            results.append({
-                                'job_name': job['job_name'],
-                                'display_name': job['display_name'],
-                                'backup_file': '',
-                                'file_path': rel_path,
-                                'size': fsize,
-                                'mode': 'direct'
-                            })
-                            count += 1
-                            if count >= 10 or len(results) >= 50:
-                                break
-                    if count >= 10 or len(results) >= 50:
-                        break
+        query_lower = query.lower()
+        results = []
+        jobs = get_all_job_configs()
 
-            if len(results) >= 50:
-                break
+        # Jobs and local archives are independent (network- or disk-bound): search
+        # them side by side, then keep the results in job order as before
+        futures = [
+            SEARCH_EXEC.submit(task)
+            for job in jobs if job.get('enabled')
+            for task in _search_tasks(job, query, query_lower)
+        ]
+        for future in futures:
+            if len(results) >= SEARCH_LIMIT:
+                future.cancel()
+                continue
+            results.extend(future.result()[:SEARCH_LIMIT - len(results)])
 
         return jsonify({'results': results, 'total': len(results), 'query': query})
     except Exception as e:
@@ -1,11 +1,13 @@
 """APScheduler management: load/reload schedules, VACUUM, schedule updates."""
 
-import sqlite3
+import threading
+import time
+
 from flask import Blueprint, request, jsonify
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 
-from .db import DB_PATH
+from .db import get_db, release_db, invalidate_job_config_caches
 from .notifications import SMTP_ENABLED, send_weekly_report
 from .utils import get_local_datetime
 
@@ -14,14 +16,24 @@ scheduler_bp = Blueprint('scheduler', __name__)
 TIMEZONE = 'Europe/Zurich'
 scheduler = BackgroundScheduler(timezone=TIMEZONE)
 
+# Coalesce bursts of job edits into a single rebuild
+RELOAD_DEBOUNCE = 0.2
+_reload_timer = None
+_reload_lock = threading.Lock()
+
+# VACUUM releases free pages in steps this big, pausing between them for writers
+VACUUM_STEP_PAGES = 512
+VACUUM_STEP_PAUSE = 0.05
+
 
 def trigger_backup_job(job_name):
-    """Trigger a backup via internal API (called by APScheduler)."""
+    """Start a backup in-process, as /run does (called by APScheduler)."""
     try:
-        import requests
-        port = int(__import__('os').environ.get('PORT', '9895'))
+        from .app import start_backup
         print(f"APScheduler: Triggering backup {job_name}")
-        requests.get(f'http://localhost:{port}/run?job={job_name}', timeout=10)
+        result = start_backup(job_name)
+        if result['status'] != 'started':
+            print(f"APScheduler: {job_name} not started ({result['status']})")
     except Exception as e:
         print(f"APScheduler: Error triggering {job_name}: {e}")
 
@@ -29,42 +41,18 @@ def trigger_backup_job(job_name):
 def load_schedules():
     """Load schedules from job_configs and create APScheduler triggers."""
     try:
+        # Only backup triggers are rebuilt; maintenance jobs added at startup stay
         for existing_job in scheduler.get_jobs():
-            existing_job.remove()
+            if existing_job.id.startswith('backup_'):
+                existing_job.remove()
 
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
-        jobs = conn.execute('''
+        jobs = get_db().execute('''
             SELECT job_name, schedule_cron FROM job_configs
             WHERE schedule_enabled = 1 AND schedule_cron != ''
         ''').fetchall()
-        conn.close()
 
         for job in jobs:
-            try:
-                cron_parts = job['schedule_cron'].split()
-                if len(cron_parts) == 5:
-                    trigger = CronTrigger(
-                        minute=cron_parts[0],
-                        hour=cron_parts[1],
-                        day=cron_parts[2],
-                        month=cron_parts[3],
-                        day_of_week=cron_parts[4],
-                        timezone=TIMEZONE
-                    )
-                    scheduler.add_job(
-                        trigger_backup_job,
-                        trigger=trigger,
-                        args=[job['job_name']],
-                        id=f'backup_{job["job_name"]}',
-                        replace_existing=True,
-                        name=f'Backup {job["job_name"]}'
-                    )
-                    print(f"APScheduler: Schedule added for {job['job_name']} ({job['schedule_cron']})")
-                else:
-                    print(f"APScheduler: Invalid cron for {job['job_name']}: {job['schedule_cron']}")
-            except Exception as e:
-                print(f"APScheduler: Error scheduling {job['job_name']}: {e}")
+            _schedule_backup(job['job_name'], job['schedule_cron'])
 
         # Bi-monthly VACUUM (1st and 15th at 3am)
         scheduler.add_job(
@@ -88,25 +76,86 @@ def load_schedules():
         else:
             print("APScheduler: Weekly report disabled (SMTP not configured)")
 
+        _clear_jobs_overview()
+
         print(f"APScheduler: {len(scheduler.get_jobs())} schedule(s) active")
     except Exception as e:
         print(f"APScheduler: Error load_schedules: {e}")
 
 
 def vacuum_db():
-    """VACUUM the SQLite database to reclaim disk space."""
+    """Reclaim disk space in short steps so backup writers never wait on a long lock.
+
+    The database is switched to auto_vacuum=INCREMENTAL once (that first run is
+    a full VACUUM); later runs hand free pages back VACUUM_STEP_PAGES at a time,
+    each step its own brief write transaction.
+    """
     try:
-        conn = sqlite3.connect(DB_PATH)
-        conn.execute('VACUUM')
-        conn.close()
-        print("APScheduler: VACUUM completed")
+        conn = get_db()
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            conn.execute('VACUUM')
+            print("APScheduler: VACUUM completed (switched to incremental auto_vacuum)")
+            return
+
+        free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        for _ in range(-(-free // VACUUM_STEP_PAGES)):
+            # executescript steps the pragma to completion; execute() frees a single page
+            conn.executescript(f'PRAGMA incremental_vacuum({VACUUM_STEP_PAGES});')
+            time.sleep(VACUUM_STEP_PAUSE)
+        print(f"APScheduler: VACUUM completed ({free} free page(s) released)")
     except Exception as e:
         print(f"APScheduler: VACUUM error: {e}")
 
 
+def _schedule_backup(job_name, cron):
+    """Add or replace the backup trigger of one job."""
+    try:
+        # Same field mapping as before; APScheduler 3 keeps 0 = Monday for day_of_week
+        trigger = CronTrigger.from_crontab(cron, timezone=TIMEZONE)
+    except ValueError as e:
+        print(f"APScheduler: Invalid cron for {job_name}: {cron} ({e})")
+        return
+    try:
+        scheduler.add_job(
+            trigger_backup_job,
+            trigger=trigger,
+            args=[job_name],
+            id=f'backup_{job_name}',
+            replace_existing=True,
+            name=f'Backup {job_name}'
+        )
+        print(f"APScheduler: Schedule added for {job_name} ({cron})")
+    except Exception as e:
+        print(f"APScheduler: Error scheduling {job_name}: {e}")
+
+
+def _clear_jobs_overview():
+    # The jobs list embeds next_run times, which just changed
+    from .jobs import get_jobs_overview
+    get_jobs_overview.cache_clear()
+
+
+def _reload_now():
+    try:
+        load_schedules()
+    finally:
+        # Short-lived timer thread: hand its connection back to the pool
+        release_db()
+
+
 def reload_schedules():
-    """Reload schedules (called after API modifications)."""
-    load_schedules()
+    """Reload schedules in the background (called after API modifications).
+
+    Each call restarts a short timer, so a burst of edits triggers one rebuild.
+    """
+    global _reload_timer
+    with _reload_lock:
+        if _reload_timer is not None:
+            _reload_timer.cancel()
+        _reload_timer = threading.Timer(RELOAD_DEBOUNCE, _reload_now)
+        _reload_timer.daemon = True
+        _reload_timer.start()
 
 
 def get_next_run_for_job(job_name):
@@ -130,23 +179,24 @@ def api_update_schedule(name):
         if not data:
             return jsonify({'error': 'JSON data required'}), 400
 
-        conn = sqlite3.connect(DB_PATH)
-        existing = conn.execute('SELECT id FROM job_configs WHERE job_name = ?', (name,)).fetchone()
-        if not existing:
-            conn.close()
-            return jsonify({'error': f'Job "{name}" not found'}), 404
-
         schedule_enabled = data.get('schedule_enabled', 0)
         schedule_cron = data.get('schedule_cron', '')
 
-        conn.execute('''
+        updated = get_db().execute('''
             UPDATE job_configs SET schedule_enabled = ?, schedule_cron = ?, updated_at = ?
             WHERE job_name = ?
-        ''', (schedule_enabled, schedule_cron, get_local_datetime().isoformat(), name))
-        conn.commit()
-        conn.close()
-
-        reload_schedules()
+        ''', (schedule_enabled, schedule_cron, get_local_datetime().isoformat(), name)).rowcount
+        if not updated:
+            return jsonify({'error': f'Job "{name}" not found'}), 404
+        invalidate_job_config_caches()
+
+        # Rebuilt before answering: the UI reloads the jobs list, next runs included, right after
+        job_id = f'backup_{name}'
+        if scheduler.get_job(job_id):
+            scheduler.remove_job(job_id)
+        if schedule_enabled and schedule_cron:
+            _schedule_backup(name, schedule_cron)
+        _clear_jobs_overview()
 
         return jsonify({'status': 'updated', 'job_name': name})
     except Exception as e:
@@ -103,6 +103,14 @@ const app = createApp({
                 console.log('WebSocket connecte');
             });
 
+            s.on('backup_status_bulk', (data) => {
+                const jobs = {};
+                for (const job of data.jobs) {
+                    jobs[job.job] = job;
+                }
+                runningJobs.value = jobs;
+            });
+
             s.on('backup_status', (data) => {
                 if (data.status === 'running') {
                     runningJobs.value = { ...runningJobs.value, [data.job]: data };
@@ -1,12 +1,86 @@
 """Shared utilities to avoid circular imports."""
 
 import os
+import sys
+import gzip
+import time
+import threading
+import hashlib
+import functools
 from datetime import datetime
-import pytz
+from zoneinfo import ZoneInfo
+from flask import request
 
-LOCAL_TZ = pytz.timezone(os.environ.get('TZ', 'Europe/Zurich'))
+# Falls back to the tzdata package when the system has no zoneinfo database
+LOCAL_TZ = ZoneInfo(os.environ.get('TZ', 'Europe/Zurich'))
 
 
 def get_local_datetime():
     """Return the current local datetime."""
     return datetime.now(LOCAL_TZ)
+
+
+def parse_iso(value):
+    """Parse an ISO-8601 timestamp; 3.11+ fromisoformat accepts a trailing 'Z' natively."""
+    if sys.version_info < (3, 11) and value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    return datetime.fromisoformat(value)
+
+
+def ttl_cache(seconds, maxsize=None):
+    """Cache a function's result per positional arguments for `seconds`.
+
+    With maxsize, the oldest entries are dropped beyond that many argument sets.
+    The wrapped function gains a cache_clear() method for write paths.
+    """
+    def decorator(func):
+        lock = threading.Lock()
+        entries = {}
+        generation = [0]
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            now = time.monotonic()
+            with lock:
+                hit = entries.get(args)
+                if hit and now - hit[0] < seconds:
+                    return hit[1]
+                gen = generation[0]
+
+            value = func(*args)
+
+            with lock:
+                # Don't store a result computed before a concurrent cache_clear()
+                if gen == generation[0]:
+                    entries.pop(args, None)
+                    entries[args] = (now, value)
+                    if maxsize and len(entries) > maxsize:
+                        del entries[next(iter(entries))]
+            return value
+
+        def cache_clear():
+            with lock:
+                generation[0] += 1
+                entries.clear()
+
+        wrapper.cache_clear = cache_clear
+        return wrapper
+    return decorator
+
+
+GZIP_MIN_SIZE = 500
+
+
+def conditional_response(response):
+    """Tag a response with a content hash ETag, answer 304 when the client has it, gzip otherwise."""
+    body = response.get_data()
+    etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+    gzip_body = len(body) >= GZIP_MIN_SIZE and request.accept_encodings['gzip'] > 0
+    response.vary.add('Accept-Encoding')
+    # The encoded representation needs its own tag
+    response.set_etag(f'{etag}-gzip' if gzip_body else etag)
+    response = response.make_conditional(request)
+    if gzip_body and response.status_code == 200:
+        response.set_data(gzip.compress(body, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response